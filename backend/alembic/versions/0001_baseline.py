@@ -0,0 +1,127 @@
+"""Baseline schema
+
+Creates the schema as it was before versioned migrations. Databases created earlier by
+create_all / migrate_db.py are adopted: existing tables are kept and only missing tables,
+columns and indexes are added.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+RISK_LEVEL = sa.Enum("LOW", "MEDIUM", "HIGH", "CRITICAL", name="risklevel")
+CONTRACT_STATUS = sa.Enum("UPLOADED", "PROCESSING", "ANALYZED", "FAILED", name="contractstatus")
+JOB_STATUS = sa.Enum("QUEUED", "RUNNING", "SUCCEEDED", "FAILED", "CANCELLED", name="jobstatus")
+
+# Columns added to contracts after its first release (previously by migrate_db.py)
+LATER_CONTRACT_COLUMNS = [
+    ("start_date", sa.DateTime()),
+    ("end_date", sa.DateTime()),
+    ("renewal_terms", sa.Text()),
+    ("notice_period_days", sa.Integer()),
+    ("file_hash", sa.String()),
+    ("file_path", sa.String()),
+]
+
+def _tables():
+    return {
+        "contracts": lambda: op.create_table(
+            "contracts",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("filename", sa.String()),
+            sa.Column("upload_date", sa.DateTime()),
+            sa.Column("status", CONTRACT_STATUS),
+            sa.Column("summary", sa.Text(), nullable=True),
+            sa.Column("metadata_json", sa.JSON(), nullable=True),
+            *[sa.Column(name, type_, nullable=True) for name, type_ in LATER_CONTRACT_COLUMNS],
+        ),
+        "clauses": lambda: op.create_table(
+            "clauses",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("contract_id", sa.Integer(), sa.ForeignKey("contracts.id")),
+            sa.Column("category", sa.String()),
+            sa.Column("text", sa.Text()),
+            sa.Column("page_number", sa.Integer(), nullable=True),
+        ),
+        "risks": lambda: op.create_table(
+            "risks",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("contract_id", sa.Integer(), sa.ForeignKey("contracts.id")),
+            sa.Column("clause_id", sa.Integer(), sa.ForeignKey("clauses.id"), nullable=True),
+            sa.Column("description", sa.Text()),
+            sa.Column("risk_level", RISK_LEVEL),
+            sa.Column("recommendation", sa.Text(), nullable=True),
+        ),
+        "alerts": lambda: op.create_table(
+            "alerts",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("contract_id", sa.Integer(), sa.ForeignKey("contracts.id")),
+            sa.Column("alert_type", sa.String()),
+            sa.Column("due_date", sa.DateTime()),
+            sa.Column("status", sa.String()),
+        ),
+        "contract_chunks": lambda: op.create_table(
+            "contract_chunks",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("contract_id", sa.Integer(), sa.ForeignKey("contracts.id")),
+            sa.Column("chunk_hash", sa.String()),
+            sa.Column("vector_id", sa.String(), unique=True),
+        ),
+        "analysis_jobs": lambda: op.create_table(
+            "analysis_jobs",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("contract_id", sa.Integer(), sa.ForeignKey("contracts.id")),
+            sa.Column("file_path", sa.String()),
+            sa.Column("status", JOB_STATUS),
+            sa.Column("priority", sa.Integer()),
+            sa.Column("attempts", sa.Integer()),
+            sa.Column("max_attempts", sa.Integer()),
+            sa.Column("next_run_at", sa.DateTime()),
+            sa.Column("progress", sa.JSON(), nullable=True),
+            sa.Column("error", sa.Text(), nullable=True),
+            sa.Column("created_at", sa.DateTime()),
+            sa.Column("started_at", sa.DateTime(), nullable=True),
+            sa.Column("finished_at", sa.DateTime(), nullable=True),
+        ),
+    }
+
+INDEXES = [
+    ("contracts", "id"), ("contracts", "filename"), ("contracts", "file_hash"),
+    ("clauses", "id"), ("clauses", "category"),
+    ("risks", "id"),
+    ("alerts", "id"),
+    ("contract_chunks", "id"), ("contract_chunks", "contract_id"), ("contract_chunks", "chunk_hash"),
+    ("analysis_jobs", "id"), ("analysis_jobs", "contract_id"), ("analysis_jobs", "status"),
+]
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    existing = set(inspector.get_table_names())
+
+    for name, create in _tables().items():
+        if name not in existing:
+            create()
+
+    if "contracts" in existing:
+        columns = {c["name"] for c in inspector.get_columns("contracts")}
+        missing = [(name, type_) for name, type_ in LATER_CONTRACT_COLUMNS if name not in columns]
+        if missing:
+            with op.batch_alter_table("contracts") as batch:
+                for name, type_ in missing:
+                    batch.add_column(sa.Column(name, type_, nullable=True))
+
+    for table, column in INDEXES:
+        op.create_index(f"ix_{table}_{column}", table, [column], if_not_exists=True)
+
+
+def downgrade() -> None:
+    for name in reversed(list(_tables())):
+        op.drop_table(name)
@@ -0,0 +1,31 @@
+"""Index foreign keys and alert due dates
+
+Clauses, risks and alerts are loaded per contract, and alerts are queried by due date.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("clauses", "contract_id"),
+    ("risks", "contract_id"),
+    ("alerts", "contract_id"),
+    ("alerts", "due_date"),
+]
+
+
+def upgrade() -> None:
+    for table, column in INDEXES:
+        op.create_index(f"ix_{table}_{column}", table, [column], if_not_exists=True)
+
+
+def downgrade() -> None:
+    for table, column in INDEXES:
+        op.drop_index(f"ix_{table}_{column}", table_name=table, if_exists=True)
@@ -0,0 +1,57 @@
+"""Materialized portfolio stats
+
+Creates portfolio_stats and fills it from the existing contracts, risks and clauses.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from collections import Counter
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+contracts = sa.table("contracts", sa.column("id", sa.Integer), sa.column("metadata_json", sa.JSON), sa.column("end_date", sa.DateTime))
+risks = sa.table("risks", sa.column("id", sa.Integer), sa.column("risk_level", sa.String))
+clauses = sa.table("clauses", sa.column("id", sa.Integer), sa.column("category", sa.String))
+
+
+def upgrade() -> None:
+    stats = op.create_table(
+        "portfolio_stats",
+        sa.Column("dimension", sa.String(), primary_key=True),
+        sa.Column("bucket", sa.String(), primary_key=True),
+        sa.Column("value", sa.Integer()),
+    )
+
+    bind = op.get_bind()
+    counts = Counter()
+    analyzed = bind.execute(
+        sa.select(sa.func.count(contracts.c.id)).where(contracts.c.metadata_json.isnot(None))
+    ).scalar()
+    if analyzed:
+        counts[("contracts", "analyzed")] = analyzed
+    for end_date, n in bind.execute(
+        sa.select(contracts.c.end_date, sa.func.count(contracts.c.id))
+        .where(contracts.c.end_date.isnot(None)).group_by(contracts.c.end_date)
+    ):
+        counts[("expiry", end_date.date().isoformat())] += n
+    for level, n in bind.execute(sa.select(risks.c.risk_level, sa.func.count(risks.c.id)).group_by(risks.c.risk_level)):
+        # Enum members are stored by name
+        counts[("risk_level", (level or "LOW").lower())] += n
+    for category, n in bind.execute(sa.select(clauses.c.category, sa.func.count(clauses.c.id)).group_by(clauses.c.category)):
+        counts[("clause_category", category or "Uncategorized")] += n
+
+    if counts:
+        op.bulk_insert(stats, [
+            {"dimension": dimension, "bucket": bucket, "value": value}
+            for (dimension, bucket), value in counts.items()
+        ])
+
+
+def downgrade() -> None:
+    op.drop_table("portfolio_stats")
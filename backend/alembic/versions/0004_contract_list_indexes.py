@@ -0,0 +1,24 @@
+"""Indexes for the contract list
+
+(upload_date, id) backs keyset pagination; end_date backs the expiry window filter.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_contracts_upload_date_id", "contracts", ["upload_date", "id"], if_not_exists=True)
+    op.create_index("ix_contracts_end_date", "contracts", ["end_date"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_contracts_end_date", table_name="contracts", if_exists=True)
+    op.drop_index("ix_contracts_upload_date_id", table_name="contracts", if_exists=True)
@@ -0,0 +1,29 @@
+"""One alert per contract and type
+
+Removes duplicate alerts left by earlier re-analyses (keeping the newest, from the latest analysis), then enforces
+uniqueness on (contract_id, alert_type) and indexes (alert_type, due_date) for range queries.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "DELETE FROM alerts WHERE id NOT IN ("
+        "SELECT MAX(id) FROM alerts GROUP BY contract_id, alert_type)"
+    )
+    op.create_index("uq_alerts_contract_type", "alerts", ["contract_id", "alert_type"], unique=True, if_not_exists=True)
+    op.create_index("ix_alerts_type_due_date", "alerts", ["alert_type", "due_date"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_alerts_type_due_date", table_name="alerts", if_exists=True)
+    op.drop_index("uq_alerts_contract_type", table_name="alerts", if_exists=True)
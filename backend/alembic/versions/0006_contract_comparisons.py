@@ -0,0 +1,34 @@
+"""Comparison result cache
+
+Creates contract_comparisons, keyed by a hash of both contracts' clause sets.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "contract_comparisons",
+        sa.Column("key", sa.String(), primary_key=True),
+        sa.Column("contract_id_1", sa.Integer(), sa.ForeignKey("contracts.id")),
+        sa.Column("contract_id_2", sa.Integer(), sa.ForeignKey("contracts.id")),
+        sa.Column("result", sa.JSON()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_contract_comparisons_contract_id_1", "contract_comparisons", ["contract_id_1"])
+    op.create_index("ix_contract_comparisons_contract_id_2", "contract_comparisons", ["contract_id_2"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_contract_comparisons_contract_id_2", table_name="contract_comparisons")
+    op.drop_index("ix_contract_comparisons_contract_id_1", table_name="contract_comparisons")
+    op.drop_table("contract_comparisons")
@@ -0,0 +1,30 @@
+"""Job leases
+
+Adds locked_by and heartbeat_at to analysis_jobs, so a process only requeues running jobs
+whose heartbeat has expired instead of every running job.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("analysis_jobs") as batch:
+        batch.add_column(sa.Column("locked_by", sa.String(), nullable=True))
+        batch.add_column(sa.Column("heartbeat_at", sa.DateTime(), nullable=True))
+    op.create_index("ix_analysis_jobs_heartbeat_at", "analysis_jobs", ["heartbeat_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_analysis_jobs_heartbeat_at", table_name="analysis_jobs")
+    with op.batch_alter_table("analysis_jobs") as batch:
+        batch.drop_column("heartbeat_at")
+        batch.drop_column("locked_by")
@@ -0,0 +1,31 @@
+"""Analyzed count by status
+
+The analyzed contract count is now read from contracts.status together with the total, so
+the ("contracts", "analyzed") counter, which was derived from metadata_json, is dropped.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+contracts = sa.table("contracts", sa.column("id", sa.Integer), sa.column("metadata_json", sa.JSON))
+stats = sa.table("portfolio_stats", sa.column("dimension", sa.String), sa.column("bucket", sa.String), sa.column("value", sa.Integer))
+
+
+def upgrade() -> None:
+    op.execute(stats.delete().where(stats.c.dimension == "contracts"))
+
+
+def downgrade() -> None:
+    analyzed = op.get_bind().execute(
+        sa.select(sa.func.count(contracts.c.id)).where(contracts.c.metadata_json.isnot(None))
+    ).scalar()
+    if analyzed:
+        op.bulk_insert(stats, [{"dimension": "contracts", "bucket": "analyzed", "value": analyzed}])
@@ -0,0 +1,31 @@
+"""Non-nullable upload_date
+
+The contract list pages by (upload_date, id), and a NULL upload_date falls outside every
+keyset comparison. Contracts without one get the epoch, which keeps them at the end of the
+newest-first list where they sorted before, and the column becomes NOT NULL.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+contracts = sa.table("contracts", sa.column("upload_date", sa.DateTime))
+
+
+def upgrade() -> None:
+    op.execute(contracts.update().where(contracts.c.upload_date.is_(None)).values(upload_date=datetime(1970, 1, 1)))
+    with op.batch_alter_table("contracts") as batch:
+        batch.alter_column("upload_date", existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("contracts") as batch:
+        batch.alter_column("upload_date", existing_type=sa.DateTime(), nullable=True)
@@ -0,0 +1,32 @@
+"""Contract total counter and status index
+
+The dashboard reads the contract total from portfolio_stats instead of counting the contracts
+table, and counts analyzed contracts through an index on contracts.status.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+contracts = sa.table("contracts", sa.column("id", sa.Integer))
+stats = sa.table("portfolio_stats", sa.column("dimension", sa.String), sa.column("bucket", sa.String), sa.column("value", sa.Integer))
+
+
+def upgrade() -> None:
+    op.create_index("ix_contracts_status", "contracts", ["status"], if_not_exists=True)
+    total = op.get_bind().execute(sa.select(sa.func.count(contracts.c.id))).scalar()
+    op.execute(stats.delete().where(stats.c.dimension == "contracts", stats.c.bucket == "total"))
+    if total:
+        op.bulk_insert(stats, [{"dimension": "contracts", "bucket": "total", "value": total}])
+
+
+def downgrade() -> None:
+    op.execute(stats.delete().where(stats.c.dimension == "contracts", stats.c.bucket == "total"))
+    op.drop_index("ix_contracts_status", table_name="contracts", if_exists=True)
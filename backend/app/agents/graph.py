@@ -1,23 +1,75 @@
-from langgraph.graph import StateGraph, END
+from typing import List
+from langgraph.graph import StateGraph, START, END
 from app.agents.state import AgentState
-from app.agents.nodes import clause_extraction_node, risk_analysis_node, summarize_node, lifecycle_node
-
-# Define the graph
-workflow = StateGraph(AgentState)
-
-# Add nodes
-workflow.add_node("extract_clauses", clause_extraction_node)
-workflow.add_node("analyze_risks", risk_analysis_node)
-workflow.add_node("lifecycle_analysis", lifecycle_node)
-workflow.add_node("summarize", summarize_node)
-
-# Define edges
-# Flow: Extract -> Analyze -> Lifecycle -> Summarize -> End
-workflow.set_entry_point("extract_clauses")
-workflow.add_edge("extract_clauses", "analyze_risks")
-workflow.add_edge("analyze_risks", "lifecycle_analysis")
-workflow.add_edge("lifecycle_analysis", "summarize")
-workflow.add_edge("summarize", END)
-
-# Compile the graph
-app_graph = workflow.compile()
+from app.agents.nodes import retrieve_context_node, clause_extraction_node, risk_analysis_node, summarize_node, lifecycle_node
+from app.core.config import settings
+
+NODES = {
+    "retrieve_context": retrieve_context_node,
+    "extract_clauses": clause_extraction_node,
+    "analyze_risks": risk_analysis_node,
+    "lifecycle_analysis": lifecycle_node,
+    "summarize": summarize_node,
+}
+
+# Sequential mode: Retrieve -> Extract -> Analyze -> Lifecycle -> Summarize -> End
+SEQUENTIAL_FLOW = ["retrieve_context", "extract_clauses", "analyze_risks", "lifecycle_analysis", "summarize"]
+
+# Parallel mode: ENTRY_NODE runs first (one batched retrieval for every agent), then
+# each branch is an ordered chain and all branches run at the same time.
+# Branches must not write the same state keys, so the join before JOIN_NODE is a plain merge.
+PARALLEL_BRANCHES = [
+    ["extract_clauses", "analyze_risks"], # writes extracted_clauses, risks
+    ["lifecycle_analysis"],               # writes lifecycle
+]
+ENTRY_NODE = "retrieve_context"
+JOIN_NODE = "summarize"
+
+def _validate_branches(branches: List[List[str]]):
+    seen = set()
+    for branch in branches:
+        if not branch:
+            raise ValueError("Parallel branches must contain at least one node")
+        for name in branch:
+            if name not in NODES:
+                raise ValueError(f"Unknown graph node: {name}")
+            if name in seen or name in (ENTRY_NODE, JOIN_NODE):
+                raise ValueError(f"Node '{name}' must appear in exactly one branch and not be the entry/join node")
+            seen.add(name)
+
+def build_graph(mode: str = None, branches: List[List[str]] = None):
+    """
+    Builds and compiles the analysis graph.
+    mode="sequential" chains every node; mode="parallel" fans out into `branches` after retrieval
+    and fans back in at the summarize node once every branch has finished.
+    """
+    mode = (mode or settings.AGENT_GRAPH_MODE).lower()
+    workflow = StateGraph(AgentState)
+
+    # Add nodes
+    for name, node in NODES.items():
+        workflow.add_node(name, node)
+
+    if mode == "sequential":
+        workflow.add_edge(START, SEQUENTIAL_FLOW[0])
+        for src, dst in zip(SEQUENTIAL_FLOW, SEQUENTIAL_FLOW[1:]):
+            workflow.add_edge(src, dst)
+    elif mode == "parallel":
+        branches = branches or PARALLEL_BRANCHES
+        _validate_branches(branches)
+        workflow.add_edge(START, ENTRY_NODE)
+        for branch in branches:
+            workflow.add_edge(ENTRY_NODE, branch[0])
+            for src, dst in zip(branch, branch[1:]):
+                workflow.add_edge(src, dst)
+        # Fan-in: the join node only runs after the last node of every branch
+        workflow.add_edge([branch[-1] for branch in branches], JOIN_NODE)
+    else:
+        raise ValueError(f"Unknown graph mode: {mode}")
+
+    workflow.add_edge(JOIN_NODE, END)
+
+    # Compile the graph
+    return workflow.compile()
+
+app_graph = build_graph()
@@ -1,27 +1,69 @@
-import json
+import asyncio
 from langchain_core.messages import SystemMessage, HumanMessage
-from app.core.llm import get_llm
+from app.core.config import settings
+from app.core.llm import get_llm, parse_json_response
 from app.agents.state import AgentState
 from app.services.rag import rag_service
 
 llm = get_llm(temperature=0.1)
 
-async def clause_extraction_node(state: AgentState):
+CLAUSE_TYPES = ["Termination", "Confidentiality", "Liability", "Payment Terms", "Renewal"]
+LIFECYCLE_QUERY = "effective date start date expiration term renewal notice period"
+
+# Every retrieval the agents make, keyed by context name: (query, k)
+RETRIEVAL_PLAN = {c_type: (f"{c_type} clause", 3) for c_type in CLAUSE_TYPES}
+RETRIEVAL_PLAN["lifecycle"] = (LIFECYCLE_QUERY, 5)
+
+def _parse_json_list(content: str) -> list:
+    data = parse_json_response(content)
+    if not isinstance(data, list):
+        raise ValueError("Batched risk response is not a JSON list")
+    return data
+
+async def retrieve_context_node(state: AgentState):
     """
-    Agent to extract critical clauses from the contract.
+    Runs every retrieval in RETRIEVAL_PLAN for the contract in one batched call,
+    so all agent queries share a single embedding pass and search.
     """
     contract_id = state["contract_id"]
-    # In a real scenario, we might iterate over chunks or use RAG to find specific sections.
-    # For this system, let's assume we query for specific clause types.
-    
-    clause_types = ["Termination", "Confidentiality", "Liability", "Payment Terms", "Renewal"]
-    extracted_clauses = []
-    
-    for c_type in clause_types:
-        # Retrieve relevant chunks for this clause type
-        docs = rag_service.retrieve(f"{c_type} clause", k=3, filter={"contract_id": contract_id})
-        context = rag_service.format_docs(docs)
-        
+    keys = list(RETRIEVAL_PLAN)
+    queries = [RETRIEVAL_PLAN[key][0] for key in keys]
+    max_k = max(k for _, k in RETRIEVAL_PLAN.values())
+
+    try:
+        # Retrieval embeds the queries on CPU, keep it off the event loop
+        results = await asyncio.to_thread(rag_service.retrieve_many, queries, max_k, {"contract_id": contract_id})
+    except Exception as e:
+        # Nodes fall back to their own retrieval when a context is missing
+        print(f"Batched retrieval error: {e}")
+        return {"contexts": {}}
+
+    contexts = {
+        key: rag_service.format_docs(docs[:RETRIEVAL_PLAN[key][1]])
+        for key, docs in zip(keys, results)
+    }
+    return {"contexts": contexts}
+
+async def _get_context(state: AgentState, key: str) -> str:
+    """
+    Returns the pre-fetched context for `key`, retrieving it on demand if it is missing.
+    """
+    contexts = state.get("contexts") or {}
+    if key in contexts:
+        return contexts[key]
+
+    query, k = RETRIEVAL_PLAN[key]
+    docs = await asyncio.to_thread(rag_service.retrieve, query, k, {"contract_id": state["contract_id"]})
+    return rag_service.format_docs(docs)
+
+async def _extract_clause(c_type: str, state: AgentState, semaphore: asyncio.Semaphore):
+    """
+    Asks the LLM to extract a single clause type from its retrieved context.
+    Returns the parsed clause dict, or None if missing / failed.
+    """
+    async with semaphore:
+        context = await _get_context(state, c_type)
+
         prompt = f"""
         You are a legal expert. Extract the '{c_type}' clause from the following context. 
         If present, provide the exact text and a brief summary.
@@ -32,77 +74,139 @@ async def clause_extraction_node(state: AgentState):
         
         Return JSON format: {{ "category": "{c_type}", "text": "...", "summary": "..." }}
         """
-        
-        response = llm.invoke([HumanMessage(content=prompt)])
-        content = response.content.strip()
-        
-        # Basic parsing (in prod, use structured output or PydanticOutputParser)
-        try:
-            # removing code blocks if any
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0]
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0]
-            
-            data = json.loads(content)
-            if data:
-                extracted_clauses.append(data)
-        except:
-            # Fallback or log error
-            pass
-            
-    return {"extracted_clauses": extracted_clauses}
 
-async def risk_analysis_node(state: AgentState):
+        response = await llm.ainvoke([HumanMessage(content=prompt)], validate=parse_json_response)
+
+    # Basic parsing (in prod, use structured output or PydanticOutputParser)
+    data = parse_json_response(response.content)
+    return data or None
+
+async def clause_extraction_node(state: AgentState):
     """
-    Agent to analyze risks in extracted clauses.
+    Agent to extract critical clauses from the contract.
+    All clause types are extracted concurrently, bounded by AGENT_MAX_CONCURRENCY.
+    A failure on one clause type does not affect the others.
     """
-    clauses = state.get("extracted_clauses", [])
-    risks = []
+    # In a real scenario, we might iterate over chunks or use RAG to find specific sections.
+    # For this system, let's assume we query for specific clause types.
     
-    for clause in clauses:
-        prompt = f"""
-        Analyze the risk level of the following '{clause['category']}' clause.
-        
-        Clause Text: "{clause.get('text', '')}"
-        
+    semaphore = asyncio.Semaphore(max(1, settings.AGENT_MAX_CONCURRENCY))
+    results = await asyncio.gather(
+        *(_extract_clause(c_type, state, semaphore) for c_type in CLAUSE_TYPES),
+        return_exceptions=True
+    )
+
+    extracted_clauses = []
+    for c_type, result in zip(CLAUSE_TYPES, results):
+        if isinstance(result, Exception):
+            print(f"Clause extraction error ({c_type}): {result}")
+        elif result:
+            extracted_clauses.append(result)
+            
+    return {"extracted_clauses": extracted_clauses}
+
+RISK_RULES = """
         Rules:
         - High Risk: Unlimited liability, auto-renewal without notice, non-compete > 2 years.
         - Medium Risk: Vague termination usage, payment > 60 days.
         - Low Risk: Standard terms.
+"""
+
+async def _score_clause(clause: dict, semaphore: asyncio.Semaphore):
+    """
+    Scores a single clause with its own LLM call.
+    """
+    prompt = f"""
+        Analyze the risk level of the following '{clause['category']}' clause.
         
+        Clause Text: "{clause.get('text', '')}"
+        {RISK_RULES}
         Return JSON: {{ "risk_level": "High|Medium|Low", "reasoning": "...", "recommendation": "..." }}
         """
+
+    async with semaphore:
+        response = await llm.ainvoke([HumanMessage(content=prompt)], validate=parse_json_response)
+
+    data = parse_json_response(response.content)
+    if not isinstance(data, dict):
+        return None
+    data["clause_category"] = clause["category"]
+    return data
+
+async def _score_clauses_concurrently(clauses: list) -> list:
+    semaphore = asyncio.Semaphore(max(1, settings.AGENT_MAX_CONCURRENCY))
+    results = await asyncio.gather(*(_score_clause(c, semaphore) for c in clauses), return_exceptions=True)
+
+    risks = []
+    for clause, result in zip(clauses, results):
+        if isinstance(result, Exception):
+            print(f"Risk analysis error ({clause.get('category')}): {result}")
+        elif result:
+            risks.append(result)
+    return risks
+
+async def _score_clauses_batched(clauses: list) -> list:
+    """
+    Scores every clause in one LLM request.
+    Returns the risks that could be matched back to a clause_category.
+    """
+    clauses_text = "\n\n".join(
+        f"[{c['category']}]\n\"{c.get('text', '')}\"" for c in clauses
+    )
+    categories = [c["category"] for c in clauses]
+
+    prompt = f"""
+        Analyze the risk level of each of the following contract clauses.
+        Each clause is labelled with its category in square brackets.
         
-        response = llm.invoke([HumanMessage(content=prompt)])
-        content = response.content.strip()
-        
+        Clauses:
+        {clauses_text}
+        {RISK_RULES}
+        Return a JSON list with exactly one object per clause, using the category label as "clause_category":
+        [
+            {{ "clause_category": "One of {categories}", "risk_level": "High|Medium|Low", "reasoning": "...", "recommendation": "..." }}
+        ]
+        """
+
+    response = await llm.ainvoke([HumanMessage(content=prompt)], validate=_parse_json_list)
+    data = _parse_json_list(response.content)
+
+    by_category = {}
+    for item in data:
+        if isinstance(item, dict) and item.get("clause_category") in categories:
+            by_category.setdefault(item["clause_category"], item)
+    return [by_category[c] for c in categories if c in by_category]
+
+async def risk_analysis_node(state: AgentState):
+    """
+    Agent to analyze risks in extracted clauses.
+    In "batch" mode all clauses are scored in a single LLM request; any clause the batch
+    response does not cover (or all of them, if it fails to parse) is scored concurrently per clause.
+    """
+    clauses = state.get("extracted_clauses", [])
+    if not clauses:
+        return {"risks": []}
+
+    risks = []
+    pending = clauses
+    if settings.RISK_SCORING_MODE.lower() == "batch":
         try:
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0]
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0]
-                
-            data = json.loads(content)
-            if data:
-                data["clause_category"] = clause["category"]
-                risks.append(data)
-        except:
-            pass
+            risks = await _score_clauses_batched(clauses)
+            scored = {r["clause_category"] for r in risks}
+            pending = [c for c in clauses if c["category"] not in scored]
+        except Exception as e:
+            print(f"Batched risk analysis failed, falling back to per-clause scoring: {e}")
+
+    if pending:
+        risks.extend(await _score_clauses_concurrently(pending))
             
     return {"risks": risks}
 
-async def summarize_node(state: AgentState):
+def build_summary_prompt(clauses: list, risks: list) -> str:
     """
-    Agent to provide an executive summary.
+    Builds the executive summary prompt from extracted clauses and identified risks.
     """
-    # We might pull a summary from the metadata or generate one from the first few chunks
-    # For now, let's just ask the LLM to summarize the risks and clauses found.
-    
     # Serialize extracted clauses and risks into context for the LLM
-    clauses = state.get("extracted_clauses", [])
-    risks = state.get("risks", [])
-    
     clauses_text = "\n".join([f"- {c['category']}: {c.get('text', 'Not found')}" for c in clauses])
     risks_text = "\n".join([f"- {r.get('clause_category')}: {r.get('risk_level')} Risk. {r.get('reasoning')}" for r in risks])
     
@@ -132,19 +236,37 @@ async def summarize_node(state: AgentState):
     Context:
     {context_str}
     """
+    return prompt
+
+async def summarize_node(state: AgentState):
+    """
+    Agent to provide an executive summary.
+    """
+    # We might pull a summary from the metadata or generate one from the first few chunks
+    # For now, let's just ask the LLM to summarize the risks and clauses found.
+    prompt = build_summary_prompt(state.get("extracted_clauses", []), state.get("risks", []))
     
     response = await llm.ainvoke([HumanMessage(content=prompt)])
     return {"summary": response.content}
 
+async def stream_summary(clauses: list, risks: list):
+    """
+    Streams the executive summary token by token (same prompt as summarize_node).
+    Always generated afresh: this is an explicit regeneration, and a cached answer would
+    arrive in one piece instead of streaming.
+    """
+    prompt = build_summary_prompt(clauses, risks)
+    async for chunk in llm.astream([HumanMessage(content=prompt)], use_cache=False):
+        if chunk.content:
+            yield chunk.content
+
 async def lifecycle_node(state: AgentState):
     """
     Agent to extract contract lifecycle dates and terms.
     """
-    contract_id = state["contract_id"]
-    
-    # Retrieve snippets related to dates and term
-    docs = rag_service.retrieve("effective date start date expiration term renewal notice period", k=5, filter={"contract_id": contract_id})
-    context = rag_service.format_docs(docs)
+    # Snippets related to dates and term
+    # Runs as a parallel branch next to extraction, so nothing here may block the event loop
+    context = await _get_context(state, "lifecycle")
     
     prompt = f"""
     Extract the following lifecycle information from the contract context:
@@ -167,16 +289,8 @@ async def lifecycle_node(state: AgentState):
     
     lifecycle_data = {}
     try:
-        response = llm.invoke([HumanMessage(content=prompt)])
-        content = response.content.strip()
-        
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-            
-        lifecycle_data = json.loads(content)
-        lifecycle_data = json.loads(content)
+        response = await llm.ainvoke([HumanMessage(content=prompt)], validate=parse_json_response)
+        lifecycle_data = parse_json_response(response.content) or {}
         # print(f"DEBUG: Extracted Lifecycle Data: {lifecycle_data}")
     except Exception as e:
         print(f"Lifecycle extraction error: {e}")
@@ -2,12 +2,16 @@ from typing import TypedDict, List, Dict, Any, Optional
 from langchain_core.messages import BaseMessage
 
 class AgentState(TypedDict):
+    # NOTE: In parallel graph mode each branch must write its own keys (see graph.PARALLEL_BRANCHES),
+    # otherwise the fan-in step would receive conflicting updates for the same key.
     contract_id: int
     contract_text: Optional[str] # Full text or summary if needed, but usually we work with chunks
     # We might pass the contract_id around and let agents fetch what they need or use RAG
     
     messages: List[BaseMessage] # Chat history
     
+    contexts: Dict[str, str] # Formatted retrieval context per RETRIEVAL_PLAN key, filled by retrieve_context
+    
     extracted_clauses: List[Dict[str, Any]] # List of extracted clauses with metadata
     risks: List[Dict[str, Any]] # List of identified risks
     
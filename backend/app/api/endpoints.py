@@ -1,13 +1,29 @@
-from fastapi import APIRouter, UploadFile, File, BackgroundTasks, HTTPException, Depends
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from typing import List, Optional
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from app.core.config import settings
+from app.db.database import get_async_db, AsyncSessionLocal
 from app.services.ingestion import ingestion_service
 from app.services.qa_service import qa_service
 from app.services.compare_service import compare_service
-from app.agents.graph import app_graph
-from app.models.db import Contract, ContractStatus, Alert, Clause, Risk, RiskLevel
-import shutil
+from app.services.job_queue import job_queue
+from app.services.bulk_upload import bulk_upload_service
+from app.services.document_parser import SUPPORTED_EXTENSIONS
+from app.services.upload_service import upload_service
+from app.services.portfolio_stats import TOTAL, portfolio_stats_service
+from app.services.contract_list import contract_list_service
+from app.services.alert_service import alert_service
+from app.db.upload_store import upload_store
+from app.agents.nodes import stream_summary
+from app.core.llm import llm_cache
+from app.db.vector_store import vector_store_manager
+from app.models.db import Contract, ContractStatus, Alert, Clause, Risk, RiskLevel, AnalysisJob
+import json
 import os
+from collections import Counter
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 
@@ -18,55 +34,175 @@ class CompareRequest(BaseModel):
     contract_id_1: int
     contract_id_2: int
 
+class BenchmarkRequest(BaseModel):
+    baseline_id: int
+    contract_ids: List[int]
+
 router = APIRouter()
 
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _sse_response(events):
+    """
+    Wraps an async generator of (event, data) tuples as a Server-Sent Events response.
+    Always ends with a "done" event, or an "error" event if the generator fails.
+    """
+    async def body():
+        try:
+            async for event, data in events:
+                yield _sse_event(event, data)
+            yield _sse_event("done", {})
+        except Exception as e:
+            print(f"Streaming error: {e}")
+            yield _sse_event("error", {"message": str(e)})
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/compare")
-async def compare_contracts(request: CompareRequest, db: Session = Depends(get_db)):
+async def compare_contracts(request: CompareRequest, db: AsyncSession = Depends(get_async_db)):
     return await compare_service.compare_contracts(request.contract_id_1, request.contract_id_2, db)
 
+@router.post("/compare/benchmark")
+async def compare_benchmark(request: BenchmarkRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Compares many contracts against one baseline (e.g. vendor drafts against the company template).
+    Streams Server-Sent Events: "accepted" with the contracts being compared (and unknown ids),
+    then one "comparison" event per contract, in the order the comparisons finish.
+    """
+    contract_ids = [i for i in dict.fromkeys(request.contract_ids) if i != request.baseline_id]
+    if not contract_ids:
+        raise HTTPException(status_code=400, detail="No contracts to compare")
+    if len(contract_ids) > settings.COMPARE_MAX_CONTRACTS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.COMPARE_MAX_CONTRACTS} contracts per benchmark")
+
+    groups = await compare_service.load_groups(db, [request.baseline_id] + contract_ids)
+    baseline = groups.get(request.baseline_id)
+    if baseline is None:
+        raise HTTPException(status_code=404, detail="Baseline contract not found")
+    others = [groups[i] for i in contract_ids if i in groups]
+
+    async def stream():
+        yield "accepted", {
+            "baseline": {"contract_id": baseline.contract_id, "filename": baseline.filename},
+            "contracts": [{"contract_id": g.contract_id, "filename": g.filename} for g in others],
+            "not_found": [i for i in contract_ids if i not in groups]
+        }
+        async for event in compare_service.benchmark(baseline, others):
+            yield event
+
+    return _sse_response(stream())
+
 @router.post("/ask/global")
 async def ask_global(request: AskRequest):
     return await qa_service.ask_question(question=request.question, contract_id=None)
 
+@router.post("/ask/global/stream")
+async def ask_global_stream(request: AskRequest):
+    return _sse_response(qa_service.stream_question(question=request.question, contract_id=None))
+
 @router.post("/ask/{contract_id}")
 async def ask_contract_question(
     contract_id: int, 
     request: AskRequest, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Check if contract exists
-    contract = db.query(Contract).filter(Contract.id == contract_id).first()
+    contract = await db.get(Contract, contract_id)
     if not contract:
         raise HTTPException(status_code=404, detail="Contract not found")
         
     response = await qa_service.ask_question(question=request.question, contract_id=contract_id)
     return response
 
+@router.post("/ask/{contract_id}/stream")
+async def ask_contract_question_stream(
+    contract_id: int, 
+    request: AskRequest, 
+    db: AsyncSession = Depends(get_async_db)
+):
+    contract = await db.get(Contract, contract_id)
+    if not contract:
+        raise HTTPException(status_code=404, detail="Contract not found")
+
+    return _sse_response(qa_service.stream_question(question=request.question, contract_id=contract_id))
+
 @router.post("/upload")
 async def upload_contract(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...), 
-    db: Session = Depends(get_db)
+    priority: int = 0,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # Save file locally
-    file_location = f"temp_{file.filename}"
-    with open(file_location, "wb+") as file_object:
-        shutil.copyfileobj(file.file, file_object)
-        
+    ext = os.path.splitext(file.filename or "")[1].lower()
+    if ext not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {ext or 'none'}")
+
+    # Stream the file into the content-addressed store
+    file_hash, file_path = await upload_store.save_upload(file, ext)
+
+    # Identical document already uploaded: link to its analysis instead of running it again
+    existing = await upload_service.find_existing(db, file_hash)
+    if existing:
+        job = await upload_service.reuse(db, existing, priority=priority)
+        return {
+            "id": existing.id,
+            "status": existing.status.value,
+            "job_id": job.id if job else None,
+            "duplicate_of": existing.id
+        }
+
     # Create DB entry
-    db_contract = Contract(filename=file.filename, status=ContractStatus.PROCESSING)
+    db_contract = Contract(
+        filename=file.filename,
+        file_hash=file_hash,
+        file_path=file_path,
+        status=ContractStatus.PROCESSING
+    )
     db.add(db_contract)
-    db.commit()
-    db.refresh(db_contract)
+    await portfolio_stats_service.apply(db, {TOTAL: 1})
+    await db.commit()
     
-    # Trigger processing in background automatically
-    background_tasks.add_task(run_analysis_pipeline, db_contract.id, file_location, db)
+    # Queue processing automatically
+    job = await job_queue.enqueue(db, db_contract.id, file_path, priority=priority)
     
-    return {"id": db_contract.id, "status": "processing"}
+    return {"id": db_contract.id, "status": "processing", "job_id": job.id}
+
+@router.post("/upload/bulk")
+async def upload_contracts_bulk(files: List[UploadFile] = File(...), priority: int = 0):
+    """
+    Uploads many contracts (files and/or zip archives) in one request.
+    Streams per-file status as Server-Sent Events: "accepted" once the contracts are created
+    (documents uploaded before are linked to their existing contract), then "file" events as
+    each document is parsed ("parsed"/"failed") and its analysis queued ("queued").
+    """
+    saved, rejected = await bulk_upload_service.save_uploads(files)
+    if not saved:
+        raise HTTPException(status_code=400, detail={"message": "No supported documents", "rejected": rejected})
+
+    entries, duplicates = await bulk_upload_service.create_contracts(saved, priority=priority)
+    events = bulk_upload_service.start(entries, priority=priority)
+
+    async def stream():
+        yield "accepted", {
+            "contracts": [{"contract_id": e["contract_id"], "filename": e["filename"]} for e in entries],
+            "duplicates": duplicates,
+            "rejected": rejected
+        }
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            yield event
+
+    return _sse_response(stream())
 
 @router.post("/analyze/{contract_id}")
-async def analyze_contract(contract_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    contract = db.query(Contract).filter(Contract.id == contract_id).first()
+async def analyze_contract(contract_id: int, priority: int = 0, db: AsyncSession = Depends(get_async_db)):
+    contract = await db.get(Contract, contract_id)
     if not contract:
         raise HTTPException(status_code=404, detail="Contract not found")
         
@@ -74,154 +210,100 @@ async def analyze_contract(contract_id: int, background_tasks: BackgroundTasks,
     # Let's do ingestion + analysis here for simplicity of the "Analyze" button.
     # But usually upload -> ingest.
     
-    # Assuming file is saved at temp_{filename}
-    file_path = f"temp_{contract.filename}"
+    file_path = upload_service.stored_path(contract)
     if not os.path.exists(file_path):
          raise HTTPException(status_code=400, detail="File not found on server")
 
-    background_tasks.add_task(run_analysis_pipeline, contract_id, file_path, db)
+    job = await job_queue.enqueue(db, contract_id, file_path, priority=priority)
+    contract.status = ContractStatus.PROCESSING
+    await db.commit()
     
-    return {"message": "Analysis started"}
+    return {"message": "Analysis started", "job_id": job.id}
 
-async def run_analysis_pipeline(contract_id: int, file_path: str, db: Session):
-    # 1. Ingest
-    try:
-        await ingestion_service.ingest_file(file_path, contract_id)
-        
-        # 2. Run Agents
-        initial_state = {"contract_id": contract_id, "extracted_clauses": [], "risks": []}
-        result = await app_graph.ainvoke(initial_state)
-        
-        # 3. Update DB
-        contract = db.query(Contract).filter(Contract.id == contract_id).first()
-        contract.summary = result.get("summary")
-        contract.status = ContractStatus.ANALYZED
-        contract.metadata_json = result # Store full result json
-        
-        # CLEAR OLD DATA (for re-runs)
-        db.query(Clause).filter(Clause.contract_id == contract_id).delete()
-        db.query(Risk).filter(Risk.contract_id == contract_id).delete()
-        db.commit() # Commit delete first
-        
-        # POPULATE CLAUSES
-        extracted_clauses = result.get("extracted_clauses", [])
-        for c_data in extracted_clauses:
-            clause = Clause(
-                contract_id=contract_id,
-                category=c_data.get("category"),
-                text=c_data.get("text", "")
-            )
-            db.add(clause)
-            
-        # POPULATE RISKS
-        risks_data = result.get("risks", [])
-        for r_data in risks_data:
-            # Map risk level string to Enum if needed, or rely on string compatibility
-            level_str = r_data.get("risk_level", "low").lower()
-            if level_str == "high": level = RiskLevel.HIGH
-            elif level_str == "medium": level = RiskLevel.MEDIUM
-            elif level_str == "critical": level = RiskLevel.CRITICAL
-            else: level = RiskLevel.LOW
-            
-            risk = Risk(
-                contract_id=contract_id,
-                clause_id=None, # We'd need complex mapping to link exact clause ID here
-                description=r_data.get("reasoning", ""), # Using reasoning as description
-                risk_level=level,
-                recommendation=r_data.get("recommendation", "")
-            )
-            db.add(risk)
-        
-        # Save lifecycle info
-        lifecycle = result.get("lifecycle", {})
-        if lifecycle:
-            # Parse dates safely
-            from datetime import datetime
-            
-            def parse_date(date_str):
-                if not date_str: return None
-                try:
-                    return datetime.strptime(date_str, "%Y-%m-%d")
-                except:
-                    return None
-
-            contract.start_date = parse_date(lifecycle.get("start_date"))
-            contract.end_date = parse_date(lifecycle.get("end_date"))
-            contract.renewal_terms = lifecycle.get("renewal_terms")
-            
-            # Safe int casting
-            import re
-            npCallback = lifecycle.get("notice_period_days")
-            if npCallback:
-                if isinstance(npCallback, int):
-                    contract.notice_period_days = npCallback
-                elif isinstance(npCallback, str):
-                    # Try to find digits
-                    ints = re.findall(r'\d+', npCallback)
-                    if ints:
-                        contract.notice_period_days = int(ints[0])
-
-            # Generate Alerts
-            if contract.end_date:
-                # Expiration Alert
-                alert_exp = Alert(
-                    contract_id=contract.id,
-                    alert_type="Contract Expiration",
-                    due_date=contract.end_date,
-                    status="pending"
-                )
-                db.add(alert_exp)
-
-                # Notice Period Alert
-                if contract.notice_period_days:
-                     notice_date = contract.end_date - timedelta(days=contract.notice_period_days)
-                     alert_notice = Alert(
-                        contract_id=contract.id,
-                        alert_type="Termination Notice Deadline",
-                        due_date=notice_date,
-                        status="pending"
-                     )
-                     db.add(alert_notice)
-
-        db.commit()
-        
-    except Exception as e:
-        print(f"Error: {e}")
-        contract = db.query(Contract).filter(Contract.id == contract_id).first()
-        contract.status = ContractStatus.FAILED
-        db.commit()
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    job = await db.get(AnalysisJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_queue.to_dict(job)
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    job = await db.get(AnalysisJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not await job_queue.cancel(db, job):
+        raise HTTPException(status_code=409, detail=f"Job already {job.status.value}")
+    return job_queue.to_dict(job)
 
 @router.get("/contracts")
-def get_contracts(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    return db.query(Contract).offset(skip).limit(limit).all()
+async def get_contracts(
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    status: Optional[ContractStatus] = None,
+    risk_level: Optional[RiskLevel] = None,
+    expires_within_days: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Lists contracts newest first. Pass the returned next_cursor to get the next page.
+    `fields` is a comma-separated subset of the list columns (summary and analysis data are
+    only returned by GET /contracts/{id}).
+    """
+    try:
+        return await contract_list_service.list_contracts(
+            db,
+            limit=limit,
+            cursor=cursor,
+            fields=fields,
+            status=status,
+            risk_level=risk_level,
+            expires_within_days=expires_within_days
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/contracts/{contract_id}")
 @router.get("/contracts/{contract_id}")
-def get_contract(contract_id: int, db: Session = Depends(get_db)):
-    from sqlalchemy.orm import selectinload
-    return db.query(Contract).filter(Contract.id == contract_id)\
-        .options(selectinload(Contract.alerts))\
-        .options(selectinload(Contract.risks))\
-        .options(selectinload(Contract.clauses))\
-        .first()
+async def get_contract(contract_id: int, db: AsyncSession = Depends(get_async_db)):
+    return await db.scalar(
+        select(Contract).where(Contract.id == contract_id)
+        .options(selectinload(Contract.alerts))
+        .options(selectinload(Contract.risks))
+        .options(selectinload(Contract.clauses))
+    )
 
 @router.delete("/contracts/{contract_id}")
-async def delete_contract(contract_id: int, db: Session = Depends(get_db)):
-    contract = db.query(Contract).filter(Contract.id == contract_id).first()
+async def delete_contract(contract_id: int, db: AsyncSession = Depends(get_async_db)):
+    contract = await db.get(Contract, contract_id, options=[selectinload(Contract.jobs)])
     if not contract:
         raise HTTPException(status_code=404, detail="Contract not found")
         
-    # Delete local file if exists
+    # Delete the stored document unless another contract shares it
     try:
-        file_path = f"temp_{contract.filename}"
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        await upload_service.remove_file(db, contract)
     except Exception as e:
         print(f"Error deleting file: {e}")
 
+    # Stop any queued or running analysis
+    for job in contract.jobs:
+        await job_queue.cancel(db, job)
+
+    # Delete the contract's vectors
+    try:
+        await ingestion_service.remove_contract(contract_id)
+    except Exception as e:
+        print(f"Error deleting vectors: {e}")
+
+    # Remove its share of the portfolio stats, in the same transaction as the delete
+    removed = await portfolio_stats_service.contribution(db, contract_id)
+    await portfolio_stats_service.apply(db, portfolio_stats_service.diff(Counter(), removed))
+    await compare_service.invalidate(db, contract_id)
+
     # Delete from DB (cascades to related tables)
-    db.delete(contract)
-    db.commit()
+    await db.delete(contract)
+    await db.commit()
     
     return {"message": "Contract deleted successfully"}
 
@@ -233,29 +315,81 @@ class RewriteRequest(BaseModel):
 async def rewrite_clause(request: RewriteRequest):
     return await qa_service.rewrite_clause(request.clause_text, request.instruction)
 
+@router.post("/rewrite/stream")
+async def rewrite_clause_stream(request: RewriteRequest):
+    return _sse_response(qa_service.stream_rewrite(request.clause_text, request.instruction))
+
+@router.get("/contracts/{contract_id}/summary/stream")
+async def stream_contract_summary(contract_id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Regenerates the executive summary from the stored analysis and streams it as it is written.
+    The finished summary is saved on the contract.
+    """
+    contract = await db.get(Contract, contract_id)
+    if not contract:
+        raise HTTPException(status_code=404, detail="Contract not found")
+    if contract.status != ContractStatus.ANALYZED:
+        raise HTTPException(status_code=400, detail="Contract has not been analyzed yet")
+
+    result = contract.metadata_json or {}
+    clauses = result.get("extracted_clauses", [])
+    risks = result.get("risks", [])
+
+    async def events():
+        parts = []
+        async for text in stream_summary(clauses, risks):
+            parts.append(text)
+            yield "token", {"text": text}
+
+        summary = "".join(parts)
+        # The request session may already be closed once the stream is running
+        async with AsyncSessionLocal() as session:
+            await session.execute(update(Contract).where(Contract.id == contract_id).values(summary=summary))
+            await session.commit()
+        yield "summary", {"summary": summary}
+
+    return _sse_response(events())
+
+@router.get("/alerts")
+async def get_alerts(
+    within_days: int = 30,
+    alert_type: Optional[str] = None,
+    status: Optional[str] = None,
+    include_overdue: bool = False,
+    limit: int = 100,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Alerts due in the next `within_days` days, soonest first, e.g. ?within_days=90 for this quarter.
+    """
+    return await alert_service.list_alerts(
+        db,
+        within_days=within_days,
+        alert_type=alert_type,
+        status=status,
+        include_overdue=include_overdue,
+        limit=limit
+    )
+
+@router.post("/alerts/{alert_id}/resolve")
+async def resolve_alert(alert_id: int, db: AsyncSession = Depends(get_async_db)):
+    alert = await db.get(Alert, alert_id)
+    if not alert:
+        raise HTTPException(status_code=404, detail="Alert not found")
+    alert.status = "resolved"
+    await db.commit()
+    return {"id": alert.id, "status": alert.status}
+
 @router.get("/analytics/stats")
-def get_analytics(db: Session = Depends(get_db)):
-    contracts = db.query(Contract).all()
-    
-    total = len(contracts)
-    analyzed = sum(1 for c in contracts if c.status == ContractStatus.ANALYZED)
-    
-    # Aggregating risks (requires deeper query or loop)
-    high_risks = 0
-    for c in contracts:
-        high_risks += sum(1 for r in c.risks if r.risk_level in [RiskLevel.HIGH, RiskLevel.CRITICAL])
-    
-    # Expiring soon (30 days)
-    expiring_soon = 0
-    now = datetime.utcnow()
-    limit = now + timedelta(days=30)
-    for c in contracts:
-        if c.end_date and now < c.end_date <= limit:
-            expiring_soon += 1
-            
-    return {
-        "total_contracts": total,
-        "analyzed_contracts": analyzed,
-        "high_risks": high_risks,
-        "expiring_soon": expiring_soon
-    }
+async def get_analytics(db: AsyncSession = Depends(get_async_db)):
+    return await portfolio_stats_service.get_stats(db)
+
+@router.get("/llm/cache/stats")
+def get_llm_cache_stats():
+    if not llm_cache:
+        return {"enabled": False}
+    return {"enabled": True, **llm_cache.stats()}
+
+@router.get("/embeddings/cache/stats")
+def get_embedding_cache_stats():
+    return vector_store_manager.embeddings.stats()
@@ -11,10 +11,74 @@ class Settings(BaseSettings):
     PINECONE_ENV: Optional[str] = None
     PINECONE_INDEX_NAME: str = "ai-intelligent-contract-agent"
     
+    # Local FAISS store (used when PINECONE_API_KEY is not set)
+    FAISS_STORE_PATH: str = "faiss_store"
+    FAISS_MERGE_FACTOR: int = 8 # Merge this many adjacent segments of the same size tier in the background
+    FAISS_MIN_SEGMENT_SIZE: int = 1000 # Segments smaller than this share the lowest size tier
+    FAISS_PURGE_DELETED_RATIO: float = 0.3 # Rewrite a segment once this share of it has been deleted
+    
+    # Embeddings
+    EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+    EMBEDDING_CACHE_PATH: str = "embedding_cache.db"
+    QUERY_EMBEDDING_CACHE_SIZE: int = 1024 # In-memory LRU entries
+    EMBEDDING_WORKERS: int = 2 # Worker threads computing document embeddings
+    EMBEDDING_BATCH_SIZE: int = 64 # Texts per forward pass, shared across concurrent ingestions
+    EMBEDDING_BATCH_WAIT_MS: int = 10 # How long a partial batch waits for more work
+    EMBEDDING_INTRA_OP_THREADS: int = 0 # torch threads per process (0 = torch default)
+    
+    # Ingestion
+    UPLOAD_STORE_PATH: str = "uploads" # Content-addressed storage for uploaded documents
+    INGEST_BATCH_SIZE: int = 64 # Chunks embedded and upserted per batch while parsing continues
+    BULK_PARSE_WORKERS: int = 2 # Processes parsing documents of a bulk upload
+    BULK_MAX_PENDING_JOBS: int = 20 # Bulk uploads wait to enqueue more analyses while this many are queued or running
+    
+    # Retrieval
+    RETRIEVAL_MODE: str = "hybrid" # "hybrid" (BM25 + vector, fused with RRF) or "vector"
+    BM25_INDEX_PATH: str = "bm25_index.db"
+    HYBRID_FETCH_FACTOR: int = 3 # Candidates fetched from each retriever = k * factor
+    RRF_K: int = 60
+    CONTEXT_TOKEN_BUDGET: int = 2500 # Max (estimated) tokens of retrieved context per prompt
+
+    # Global Q&A (contract-level index, then chunks within the selected contracts)
+    CONTRACT_INDEX_PATH: str = "contract_index.db" # Contract profiles (summary + lifecycle metadata)
+    GLOBAL_QA_CANDIDATE_CONTRACTS: int = 8 # Contracts selected from the contract-level index per question
+    GLOBAL_QA_CHUNKS_PER_CONTRACT: int = 4
+    GLOBAL_QA_MAX_CONCURRENCY: int = 5 # Per-contract answers generated at once
+    
     DATABASE_URL: str = "sqlite:///./sql_app.db"
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000 # How long a writer waits for the lock before failing
+    SQLITE_CACHE_SIZE_KB: int = 65536 # Page cache per connection
+    SQLITE_MMAP_SIZE_MB: int = 256
     
     LOG_LEVEL: str = "INFO"
 
+    # LLM Response Cache
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_PATH: str = "llm_cache.db"
+    LLM_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    LLM_CACHE_MAX_ENTRIES: int = 10000
+
+    # Agent Pipeline
+    AGENT_MAX_CONCURRENCY: int = 5 # Max in-flight LLM calls per agent node
+    AGENT_GRAPH_MODE: str = "parallel" # "parallel" (fan-out/fan-in) or "sequential"
+    RISK_SCORING_MODE: str = "batch" # "batch" (one request for all clauses) or "concurrent"
+
+    # Analysis Job Queue
+    JOB_WORKERS: int = 2 # Analyses running at the same time
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF_SECONDS: int = 30 # Doubled on every retry
+    JOB_POLL_INTERVAL_SECONDS: float = 5.0
+    JOB_LEASE_SECONDS: int = 120 # A running job whose heartbeat is older than this is requeued
+
+    # Lifecycle Alerts
+    ALERT_SWEEP_INTERVAL_SECONDS: float = 300.0 # How often pending alerts past their date are marked due
+
+    # Contract Comparison
+    COMPARE_MAX_CONCURRENCY: int = 5 # Comparisons of a benchmark run in flight at once
+    COMPARE_MAX_CONTRACTS: int = 200 # Contracts compared against one baseline per request
+
     class Config:
         env_file = ".env"
 
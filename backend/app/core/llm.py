@@ -1,18 +1,226 @@
+import asyncio
+import hashlib
+import json
 import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, List, Optional
 from langchain_cerebras import ChatCerebras
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
 from app.core.config import settings
 
+MODEL_NAME = "llama-3.3-70b" # Using a strong model for reasoning
+
+# Cached responses are replayed to streaming callers one word (plus its trailing whitespace) at a time
+_REPLAY_CHUNK = re.compile(r"\s*\S+\s*|\s+")
+
+# Parses or checks a response; raising means the response must not be cached
+Validator = Callable[[str], Any]
+
+def parse_json_response(content: str) -> Any:
+    """
+    Strips markdown code fences from an LLM response and parses the JSON body.
+    Raises if the body is not valid JSON, so it doubles as a cache validator.
+    """
+    content = content.strip()
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0]
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0]
+    return json.loads(content)
+
+class LLMCache:
+    """
+    Persistent LLM response cache backed by SQLite.
+    Entries are keyed by model, temperature and the prompt (with template indentation stripped),
+    expire after `ttl_seconds` and are evicted least-recently-used beyond `max_entries`.
+    """
+    def __init__(self, path: str, ttl_seconds: int, max_entries: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                content TEXT,
+                created_at REAL,
+                accessed_at REAL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_accessed_at ON llm_cache (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, temperature: float, messages: List[BaseMessage]) -> str:
+        # Prompts are built from indented f-strings: strip the indentation of each line, but keep
+        # whitespace inside lines and line breaks, which may belong to the user's content
+        prompt = "\n".join(
+            f"{m.type}: " + "\n".join(line.strip() for line in str(m.content).strip().splitlines())
+            for m in messages
+        )
+        raw = f"{model}|{float(temperature)}|{prompt}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row and now - row[1] <= self.ttl_seconds:
+                self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                self.hits += 1
+                return row[0]
+            if row:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+            self.misses += 1
+            return None
+
+    def set(self, key: str, model: str, content: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, content, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model, content, now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        overflow = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+class CachedLLM:
+    """
+    Wraps a chat model with the shared response cache.
+    Pass use_cache=False to invoke/ainvoke/astream to bypass the cache for a single call.
+    Callers that parse the response should pass `validate` (e.g. their JSON parser): a fresh
+    response is only cached if it passes, so a truncated or malformed answer is retried next
+    time instead of being replayed from the cache.
+    """
+    def __init__(self, client: ChatCerebras, model: str, temperature: float, cache: Optional[LLMCache]):
+        self.client = client
+        self.model = model
+        self.temperature = temperature
+        self.cache = cache
+
+    def _key(self, messages: List[BaseMessage]) -> str:
+        return LLMCache.make_key(self.model, self.temperature, messages)
+
+    @staticmethod
+    def _cacheable(content: str, validate: Optional[Validator]) -> bool:
+        if validate is None:
+            return True
+        try:
+            validate(content)
+            return True
+        except Exception:
+            return False
+
+    def invoke(self, messages: List[BaseMessage], use_cache: bool = True, validate: Optional[Validator] = None, **kwargs) -> BaseMessage:
+        if not (self.cache and use_cache):
+            return self.client.invoke(messages, **kwargs)
+
+        key = self._key(messages)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return AIMessage(content=cached)
+
+        response = self.client.invoke(messages, **kwargs)
+        if self._cacheable(response.content, validate):
+            self.cache.set(key, self.model, response.content)
+        return response
+
+    async def ainvoke(self, messages: List[BaseMessage], use_cache: bool = True, validate: Optional[Validator] = None, **kwargs) -> BaseMessage:
+        if not (self.cache and use_cache):
+            return await self.client.ainvoke(messages, **kwargs)
+
+        # SQLite access is blocking, keep it off the event loop
+        key = self._key(messages)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            return AIMessage(content=cached)
+
+        response = await self.client.ainvoke(messages, **kwargs)
+        if self._cacheable(response.content, validate):
+            await asyncio.to_thread(self.cache.set, key, self.model, response.content)
+        return response
+
+    async def astream(self, messages: List[BaseMessage], use_cache: bool = True, validate: Optional[Validator] = None, **kwargs) -> AsyncIterator[BaseMessage]:
+        """
+        Streams response chunks. A cached response is replayed word by word, so callers
+        see the same incremental stream; a fresh one is cached once the stream has completed.
+        """
+        if not (self.cache and use_cache):
+            async for chunk in self.client.astream(messages, **kwargs):
+                yield chunk
+            return
+
+        key = self._key(messages)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            for piece in _REPLAY_CHUNK.findall(cached):
+                yield AIMessageChunk(content=piece)
+            return
+
+        parts = []
+        async for chunk in self.client.astream(messages, **kwargs):
+            parts.append(chunk.content)
+            yield chunk
+        content = "".join(parts)
+        if self._cacheable(content, validate):
+            await asyncio.to_thread(self.cache.set, key, self.model, content)
+
+llm_cache = LLMCache(
+    settings.LLM_CACHE_PATH,
+    ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES
+) if settings.LLM_CACHE_ENABLED else None
+
 def get_llm(temperature=0.0):
     """
-    Returns a configured ChatCerebras instance.
+    Returns a configured ChatCerebras instance wrapped with the shared response cache.
     """
     if not settings.CEREBRAS_API_KEY:
         raise ValueError("CEREBRAS_API_KEY is not set")
-        
-    return ChatCerebras(
+
+    client = ChatCerebras(
         api_key=settings.CEREBRAS_API_KEY,
-        model="llama-3.3-70b", # Using a strong model for reasoning
+        model=MODEL_NAME,
         temperature=temperature,
         max_retries=3,
         # fallback mechanisms can be implemented here if needed
     )
+    return CachedLLM(client, MODEL_NAME, temperature, llm_cache)
@@ -0,0 +1,135 @@
+import json
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import List, Optional, Tuple
+from langchain_core.documents import Document
+from app.core.config import settings
+
+# Keeps amounts and section numbers ("$1,000,000", "12.3") as single tokens
+TOKEN_RE = re.compile(r"\$?\d+(?:[.,]\d+)*|[a-z]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "was", "were", "will", "with"
+}
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+class BM25Index:
+    """
+    Local inverted index with BM25 scoring, stored in SQLite.
+    Chunks are added and removed incrementally by id (the same id used in the vector store).
+    """
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                contract_id INTEGER,
+                length INTEGER,
+                text TEXT,
+                metadata TEXT
+            );
+            CREATE INDEX IF NOT EXISTS ix_chunks_contract_id ON chunks (contract_id);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT,
+                chunk_id TEXT,
+                tf INTEGER,
+                PRIMARY KEY (term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS ix_postings_chunk_id ON postings (chunk_id);
+            """
+        )
+        self._conn.commit()
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[dict]):
+        with self._lock:
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                terms = Counter(tokenize(text))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO chunks (chunk_id, contract_id, length, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                    (chunk_id, metadata.get("contract_id"), sum(terms.values()), text, json.dumps(metadata))
+                )
+                self._conn.execute("DELETE FROM postings WHERE chunk_id = ?", (chunk_id,))
+                self._conn.executemany(
+                    "INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                    [(term, chunk_id, tf) for term, tf in terms.items()]
+                )
+            self._conn.commit()
+
+    def delete(self, ids: List[str]):
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM postings WHERE chunk_id = ?", [(i,) for i in ids])
+            self._conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(i,) for i in ids])
+            self._conn.commit()
+
+    def missing(self, ids: List[str]) -> List[str]:
+        """
+        Returns the ids that are not indexed yet.
+        """
+        if not ids:
+            return []
+        with self._lock:
+            found = set()
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT chunk_id FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update(r[0] for r in rows)
+        return [i for i in ids if i not in found]
+
+    def search(self, query: str, k: int = 4, contract_id: Optional[int] = None) -> List[Tuple[Document, float]]:
+        """
+        Returns up to k (Document, score) pairs, best first, optionally limited to one contract.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            total, avg_length = self._conn.execute("SELECT COUNT(*), AVG(length) FROM chunks").fetchone()
+            if not total:
+                return []
+            avg_length = avg_length or 1.0
+
+            scores = Counter()
+            for term in terms:
+                df = self._conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+                if not df:
+                    continue
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+
+                if contract_id is None:
+                    rows = self._conn.execute(
+                        "SELECT p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id "
+                        "WHERE p.term = ?", (term,)
+                    ).fetchall()
+                else:
+                    rows = self._conn.execute(
+                        "SELECT p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id "
+                        "WHERE p.term = ? AND c.contract_id = ?", (term, contract_id)
+                    ).fetchall()
+
+                for chunk_id, tf, length in rows:
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / norm
+
+            results = []
+            for chunk_id, score in scores.most_common(k):
+                text, metadata = self._conn.execute(
+                    "SELECT text, metadata FROM chunks WHERE chunk_id = ?", (chunk_id,)
+                ).fetchone()
+                results.append((Document(page_content=text, metadata=json.loads(metadata)), score))
+        return results
+
+bm25_index = BM25Index(settings.BM25_INDEX_PATH)
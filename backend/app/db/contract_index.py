@@ -0,0 +1,98 @@
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from app.core.config import settings
+from app.db.bm25_index import BM25Index
+from app.db.vector_store import vector_store_manager
+
+class ContractIndex:
+    """
+    Contract-level index: one profile per contract (summary and lifecycle metadata), searched
+    to pick the contracts a global question is about before any chunk is searched.
+    Profile vectors are stored in SQLite and scored in memory as one matrix product (cosine);
+    in hybrid mode a BM25 index over the same profiles is fused in with reciprocal-rank fusion.
+    """
+    def __init__(self, path: str, embeddings: Embeddings):
+        self.embeddings = embeddings
+        self.keywords = BM25Index(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS profiles (contract_id INTEGER PRIMARY KEY, vector BLOB)")
+        self._conn.commit()
+        self._vectors: Optional[Dict[int, np.ndarray]] = None
+        # (contract ids, matrix) snapshot rebuilt on the first search after a change
+        self._matrix = None
+
+    def _load(self):
+        if self._vectors is None:
+            rows = self._conn.execute("SELECT contract_id, vector FROM profiles").fetchall()
+            self._vectors = {cid: np.frombuffer(blob, dtype=np.float32) for cid, blob in rows}
+
+    @staticmethod
+    def _key(contract_id: int) -> str:
+        return f"profile-{contract_id}"
+
+    def upsert(self, contract_id: int, text: str):
+        vector = np.asarray(self.embeddings.embed_documents([text])[0], dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        with self._lock:
+            self._load()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO profiles (contract_id, vector) VALUES (?, ?)", (contract_id, vector.tobytes())
+            )
+            self._conn.commit()
+            self._vectors[contract_id] = vector
+            self._matrix = None
+        self.keywords.add([self._key(contract_id)], [text], [{"contract_id": contract_id}])
+
+    def delete(self, contract_id: int):
+        with self._lock:
+            self._load()
+            self._conn.execute("DELETE FROM profiles WHERE contract_id = ?", (contract_id,))
+            self._conn.commit()
+            if self._vectors.pop(contract_id, None) is not None:
+                self._matrix = None
+        self.keywords.delete([self._key(contract_id)])
+
+    def missing(self, contract_ids: List[int]) -> List[int]:
+        with self._lock:
+            self._load()
+            return [cid for cid in contract_ids if cid not in self._vectors]
+
+    def size(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._vectors)
+
+    def search(self, query: str, k: int) -> List[int]:
+        """
+        Ids of the k contracts whose profiles best match the query, best first.
+        """
+        with self._lock:
+            self._load()
+            if self._matrix is None and self._vectors:
+                ids = list(self._vectors)
+                self._matrix = (np.array(ids, dtype=np.int64), np.vstack([self._vectors[cid] for cid in ids]))
+            matrix = self._matrix
+        if matrix is None:
+            return []
+
+        ids, vectors = matrix
+        fetch_k = k * settings.HYBRID_FETCH_FACTOR
+        query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        scores = vectors @ (query_vector / (np.linalg.norm(query_vector) or 1.0))
+        top = np.argpartition(-scores, min(fetch_k, len(scores)) - 1)[:fetch_k]
+        vector_ranking = [int(ids[i]) for i in top[np.argsort(-scores[top])]]
+        if settings.RETRIEVAL_MODE.lower() != "hybrid":
+            return vector_ranking[:k]
+
+        keyword_ranking = [doc.metadata["contract_id"] for doc, _ in self.keywords.search(query, k=fetch_k)]
+        fused: Dict[int, float] = {}
+        for ranking in (vector_ranking, keyword_ranking):
+            for rank, contract_id in enumerate(ranking, start=1):
+                fused[contract_id] = fused.get(contract_id, 0.0) + 1.0 / (settings.RRF_K + rank)
+        return sorted(fused, key=fused.get, reverse=True)[:k]
+
+contract_index = ContractIndex(settings.CONTRACT_INDEX_PATH, vector_store_manager.embeddings)
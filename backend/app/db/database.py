@@ -1,14 +1,67 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from app.core.config import settings
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Async drivers for the same database: aiosqlite for SQLite, asyncpg for PostgreSQL
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg"}
+
+def to_async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    if "+" in scheme:
+        return url # Driver chosen explicitly
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+def to_sync_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    if scheme in ASYNC_DRIVERS.values():
+        return f"{scheme.split('+')[0]}{sep}{rest}"
+    return url
+
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+IS_MEMORY = IS_SQLITE and (":memory:" in SQLALCHEMY_DATABASE_URL or SQLALCHEMY_DATABASE_URL.rstrip("/").endswith("sqlite:"))
+
+def _engine_options() -> dict:
+    options = {"pool_pre_ping": not IS_SQLITE}
+    if IS_SQLITE:
+        options["connect_args"] = {"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000}
+    if not IS_MEMORY:
+        # Sized so concurrent readers (API, job workers, bulk uploads) do not queue behind each other
+        options["pool_size"] = settings.DB_POOL_SIZE
+        options["max_overflow"] = settings.DB_MAX_OVERFLOW
+    return options
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL lets readers run while the analysis pipeline writes; synchronous=NORMAL is durable
+    under WAL except for the last transactions on power loss.
+    """
+    cursor = dbapi_connection.cursor()
+    if not IS_MEMORY:
+        cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}") # Negative = KiB
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE_MB) * 1024 * 1024}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+# Sync engine: migrations and scripts
+engine = create_engine(to_sync_url(SQLALCHEMY_DATABASE_URL), **_engine_options())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine: API handlers and background tasks
+async_engine = create_async_engine(to_async_url(SQLALCHEMY_DATABASE_URL), **_engine_options())
+# Objects stay usable after commit, so handlers can return them without lazy reloads
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+if IS_SQLITE:
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+
 Base = declarative_base()
 
 def get_db():
@@ -17,3 +70,10 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    """
+    Request-scoped async session. Background tasks must open their own with AsyncSessionLocal().
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,130 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+class _Request:
+    def __init__(self, texts: List[str], future: Future):
+        self.texts = texts
+        self.future = future
+        self.offset = 0 # Next text to schedule
+        self.results: List[Optional[List[float]]] = [None] * len(texts)
+        self.remaining = len(texts)
+        self.lock = threading.Lock()
+
+class EmbeddingExecutor:
+    """
+    Runs embedding work on dedicated worker threads instead of the caller's thread.
+    Texts from concurrent requests are micro-batched together (up to `batch_size`, waiting at most
+    `max_wait_ms` for more work), so several small ingestions share forward passes, and large
+    ingestions are split across workers. The model releases the GIL while encoding, so throughput
+    scales with `workers` x `intra_op_threads` cores.
+    """
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        workers: int = 2,
+        batch_size: int = 64,
+        max_wait_ms: int = 10,
+        intra_op_threads: int = 0
+    ):
+        self._embed_fn = embed_fn
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.intra_op_threads = intra_op_threads
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._carry: Optional[_Request] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        # Bounds batches waiting for a worker, so the dispatcher does not run ahead of the pool
+        self._slots = threading.Semaphore(self.workers * 2)
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._pool:
+            return
+        with self._start_lock:
+            if self._pool:
+                return
+            if self.intra_op_threads:
+                try:
+                    import torch
+                    torch.set_num_threads(self.intra_op_threads)
+                except ImportError:
+                    pass
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embedding")
+            threading.Thread(target=self._dispatch_loop, name="embedding-dispatch", daemon=True).start()
+
+    # --- Public API ---
+
+    def submit(self, texts: List[str]) -> Future:
+        future: Future = Future()
+        if not texts:
+            future.set_result([])
+            return future
+        self._ensure_started()
+        self._queue.put(_Request(list(texts), future))
+        return future
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.submit(texts).result()
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.wrap_future(self.submit(texts))
+
+    # --- Dispatcher ---
+
+    def _next_request(self, timeout: Optional[float]) -> Optional[_Request]:
+        if self._carry:
+            request, self._carry = self._carry, None
+            return request
+        try:
+            if timeout is None:
+                return self._queue.get()
+            return self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _dispatch_loop(self):
+        while True:
+            request = self._next_request(None)
+            deadline = time.monotonic() + self.max_wait
+            parts = []
+            size = 0
+            while request:
+                take = min(self.batch_size - size, len(request.texts) - request.offset)
+                parts.append((request, request.offset, request.offset + take))
+                request.offset += take
+                size += take
+                if request.offset < len(request.texts):
+                    self._carry = request # Batch is full, continue this request in the next one
+                    break
+                if size >= self.batch_size:
+                    break
+                request = self._next_request(deadline - time.monotonic())
+
+            self._slots.acquire()
+            self._pool.submit(self._run_batch, parts)
+
+    def _run_batch(self, parts):
+        try:
+            texts = [t for request, start, end in parts for t in request.texts[start:end]]
+            vectors = self._embed_fn(texts)
+            position = 0
+            for request, start, end in parts:
+                count = end - start
+                with request.lock:
+                    request.results[start:end] = vectors[position:position + count]
+                    request.remaining -= count
+                    done = request.remaining == 0
+                position += count
+                if done and not request.future.done():
+                    request.future.set_result(request.results)
+        except Exception as e:
+            for request, _, _ in parts:
+                if not request.future.done():
+                    request.future.set_exception(e)
+        finally:
+            self._slots.release()
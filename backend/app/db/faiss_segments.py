@@ -0,0 +1,358 @@
+import json
+import math
+import os
+import pickle
+import shutil
+import threading
+from typing import Dict, List, Optional
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+MANIFEST = "manifest.json"
+LEGACY_INDEX_PATH = "faiss_index"
+
+class FaissSegmentStore:
+    """
+    Append-only on-disk format for the local FAISS vector store.
+
+    Every ingestion writes one new immutable segment (vectors + documents) and every delete
+    appends a tombstone naming the segment that holds the vector; both are committed by
+    atomically swapping manifest.json. Nothing existing is rewritten, so persisting an
+    ingestion costs the same regardless of vault size and a crash mid-write leaves the
+    previous manifest intact.
+
+    Segments are merged in a background thread by size tier: once `merge_factor` adjacent
+    segments fall in the same tier, only those are read and merged into one, so every vector
+    is rewritten O(log(vault size)) times and large segments are left alone. A segment is
+    rewritten on its own once `purge_deleted_ratio` of it has been deleted.
+    """
+    def __init__(self, path: str, merge_factor: int = 8, min_segment_size: int = 1000, purge_deleted_ratio: float = 0.3):
+        self.path = path
+        self.merge_factor = max(2, merge_factor)
+        self.min_segment_size = max(1, min_segment_size)
+        self.purge_deleted_ratio = purge_deleted_ratio
+        self.lock = threading.RLock()
+        self._compacting = False
+        # Vectors added but not yet persisted, per ingestion: key -> (vector arrays, entries, metric)
+        self._staged: Dict[str, tuple] = {}
+        # Segment file holding each live vector id, built by load() and kept up to date
+        self._locations: Dict[str, str] = {}
+        os.makedirs(os.path.join(path, "segments"), exist_ok=True)
+        self.manifest = self._read_manifest()
+
+    # --- Manifest ---
+
+    def _read_manifest(self) -> dict:
+        manifest_path = os.path.join(self.path, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                return json.load(f)
+        # segments: [{"id", "file", "count", "deleted"}],
+        # tombstones: [{"id": vector id, "upto": last segment id it applies to, "file": segment holding it}]
+        return {"version": 0, "next_segment": 1, "segments": [], "tombstones": []}
+
+    def _write_manifest(self, manifest: dict):
+        manifest = dict(manifest, version=manifest["version"] + 1)
+        self._atomic_write(os.path.join(self.path, MANIFEST), json.dumps(manifest).encode("utf-8"))
+        self.manifest = manifest
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    # --- Segments ---
+
+    def _segment_path(self, name: str) -> str:
+        return os.path.join(self.path, "segments", name)
+
+    def _write_segment(self, name: str, vectors: np.ndarray, entries: List[tuple], metric: int):
+        index = faiss.IndexFlat(vectors.shape[1], metric)
+        index.add(vectors)
+        tmp_index = self._segment_path(f"{name}.faiss.tmp")
+        faiss.write_index(index, tmp_index)
+        os.replace(tmp_index, self._segment_path(f"{name}.faiss"))
+        self._atomic_write(self._segment_path(f"{name}.pkl"), pickle.dumps(entries))
+
+    def _read_segment(self, name: str):
+        path = self._segment_path(f"{name}.faiss")
+        try:
+            index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except Exception:
+            index = faiss.read_index(path)
+        with open(self._segment_path(f"{name}.pkl"), "rb") as f:
+            entries = pickle.load(f)
+        return index, entries
+
+    def _remove_segment_files(self, name: str):
+        for ext in (".faiss", ".pkl"):
+            try:
+                os.remove(self._segment_path(f"{name}{ext}"))
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _snapshot(store: FAISS, start: int, end: int):
+        """
+        Copies vectors and (docstore id, Document) entries for index positions [start, end).
+        """
+        vectors = store.index.reconstruct_n(start, end - start)
+        entries = []
+        for position in range(start, end):
+            doc_id = store.index_to_docstore_id[position]
+            entries.append((doc_id, store.docstore.search(doc_id)))
+        return np.ascontiguousarray(vectors, dtype=np.float32), entries
+
+    def _write_new_segment(self, vector_arrays: List[np.ndarray], entries: List[tuple], metric: int):
+        """
+        Writes a new segment after every existing one and registers it. Must hold the lock.
+        """
+        manifest = dict(self.manifest)
+        segment_id = manifest["next_segment"]
+        name = f"seg-{segment_id:06d}"
+        self._write_segment(name, np.ascontiguousarray(np.concatenate(vector_arrays), dtype=np.float32), entries, metric)
+
+        manifest["segments"] = manifest["segments"] + [{"id": segment_id, "file": name, "count": len(entries), "deleted": 0}]
+        manifest["next_segment"] = segment_id + 1
+        self._write_manifest(manifest)
+        for doc_id, _ in entries:
+            self._locations[doc_id] = name
+
+    # --- Public API ---
+
+    def load(self, embeddings) -> Optional[FAISS]:
+        """
+        Rebuilds the in-memory FAISS store from the manifest, skipping tombstoned entries.
+        A legacy single-file index is imported as the first segment.
+        Tombstones are resolved to the segments they hide entries in, so later merges can drop them.
+        """
+        with self.lock:
+            if not self.manifest["segments"] and os.path.exists(LEGACY_INDEX_PATH):
+                legacy = FAISS.load_local(LEGACY_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
+                if legacy.index.ntotal:
+                    self.append(legacy, 0)
+                return legacy
+            if not self.manifest["segments"]:
+                return None
+
+            tombstones: Dict[str, int] = {}
+            for t in self.manifest["tombstones"]:
+                tombstones[t["id"]] = max(t["upto"], tombstones.get(t["id"], 0))
+
+            index = None
+            docs: Dict[str, Document] = {}
+            index_to_docstore_id: Dict[int, str] = {}
+            resolved, segments = [], []
+            self._locations = {}
+            for segment in self.manifest["segments"]:
+                seg_index, entries = self._read_segment(segment["file"])
+                if index is None:
+                    index = faiss.IndexFlat(seg_index.d, seg_index.metric_type)
+
+                keep, dead = [], 0
+                for i, (doc_id, _) in enumerate(entries):
+                    if tombstones.get(doc_id, 0) >= segment["id"]:
+                        dead += 1
+                        resolved.append({"id": doc_id, "upto": tombstones[doc_id], "file": segment["file"]})
+                    elif doc_id not in docs:
+                        keep.append(i)
+                segments.append(dict(segment, count=len(entries), deleted=dead))
+                if not keep:
+                    continue
+                vectors = seg_index.reconstruct_n(0, seg_index.ntotal)[keep]
+                start = index.ntotal
+                index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+                for offset, i in enumerate(keep):
+                    doc_id, doc = entries[i]
+                    docs[doc_id] = doc
+                    index_to_docstore_id[start + offset] = doc_id
+                    self._locations[doc_id] = segment["file"]
+
+            if resolved != self.manifest["tombstones"] or segments != self.manifest["segments"]:
+                self._write_manifest(dict(self.manifest, segments=segments, tombstones=resolved))
+
+            store = FAISS(
+                embedding_function=embeddings,
+                index=index,
+                docstore=InMemoryDocstore(docs),
+                index_to_docstore_id=index_to_docstore_id
+            )
+        self.maybe_compact()
+        return store
+
+    def append(self, store: FAISS, start: int):
+        """
+        Persists index positions [start, ntotal) of `store` as a new segment.
+        """
+        with self.lock:
+            end = store.index.ntotal
+            if end <= start:
+                return
+            vectors, entries = self._snapshot(store, start, end)
+            self._write_new_segment([vectors], entries, store.index.metric_type)
+        self.maybe_compact()
+
+    def stage(self, key: str, store: FAISS, start: int):
+        """
+        Like append, but holds the vectors at positions [start, ntotal) in memory until
+        commit(key), so an ingestion made of many batches is written as one segment.
+        """
+        with self.lock:
+            end = store.index.ntotal
+            if end <= start:
+                return
+            vectors, entries = self._snapshot(store, start, end)
+            staged_vectors, staged_entries, _ = self._staged.get(key, ([], [], None))
+            self._staged[key] = (staged_vectors + [vectors], staged_entries + entries, store.index.metric_type)
+
+    def commit(self, key: str, store: FAISS):
+        """
+        Writes everything staged under `key` as one segment. Entries deleted from `store`
+        since they were staged are left out, as no tombstone would hide them.
+        """
+        with self.lock:
+            staged = self._staged.pop(key, None)
+            if staged is None:
+                return
+            vector_arrays, entries, metric = staged
+            live = set(store.index_to_docstore_id.values())
+            keep = [i for i, (doc_id, _) in enumerate(entries) if doc_id in live]
+            if not keep:
+                return
+            vectors = np.concatenate(vector_arrays)[keep]
+            self._write_new_segment([vectors], [entries[i] for i in keep], metric)
+        self.maybe_compact()
+
+    def discard(self, key: str) -> List[str]:
+        """
+        Drops what is staged under `key` without writing it. Returns the staged vector ids.
+        """
+        with self.lock:
+            staged = self._staged.pop(key, None)
+        return [doc_id for doc_id, _ in staged[1]] if staged else []
+
+    def delete(self, ids: List[str]):
+        """
+        Records tombstones for deleted vector ids. Each hides the id in the segment holding it.
+        Ids that were never persisted (still staged) need no tombstone.
+        """
+        if not ids:
+            return
+        with self.lock:
+            manifest = dict(self.manifest)
+            upto = manifest["next_segment"] - 1
+            deleted: Dict[str, int] = {}
+            tombstones = []
+            for doc_id in ids:
+                file = self._locations.pop(doc_id, None)
+                if file is not None:
+                    tombstones.append({"id": doc_id, "upto": upto, "file": file})
+                    deleted[file] = deleted.get(file, 0) + 1
+            if not tombstones:
+                return
+            manifest["tombstones"] = manifest["tombstones"] + tombstones
+            manifest["segments"] = [
+                dict(s, deleted=s.get("deleted", 0) + deleted[s["file"]]) if s["file"] in deleted else s
+                for s in manifest["segments"]
+            ]
+            self._write_manifest(manifest)
+        self.maybe_compact()
+
+    def maybe_compact(self):
+        with self.lock:
+            if self._compacting or self._plan() is None:
+                return
+            self._compacting = True
+        threading.Thread(target=self._compact, daemon=True).start()
+
+    # --- Compaction ---
+
+    def _tier(self, segment: dict) -> int:
+        live = segment["count"] - segment.get("deleted", 0)
+        if live < self.min_segment_size:
+            return 0
+        return 1 + int(math.log(live / self.min_segment_size, self.merge_factor))
+
+    def _plan(self) -> Optional[List[dict]]:
+        """
+        Next group of segments to rewrite, or None: a segment with too many deleted entries,
+        else the first run of `merge_factor` adjacent segments in the same size tier.
+        """
+        segments = self.manifest["segments"]
+        for segment in segments:
+            if segment["count"] and segment.get("deleted", 0) / segment["count"] >= self.purge_deleted_ratio:
+                return [segment]
+
+        run: List[dict] = []
+        for segment in segments:
+            if run and self._tier(segment) != self._tier(run[0]):
+                run = []
+            run.append(segment)
+            if len(run) >= self.merge_factor:
+                return run
+        return None
+
+    def _compact(self):
+        try:
+            while True:
+                with self.lock:
+                    group = self._plan()
+                if group is None:
+                    return
+                self._rewrite(group)
+        except Exception as e:
+            print(f"FAISS compaction error: {e}")
+        finally:
+            with self.lock:
+                self._compacting = False
+
+    def _rewrite(self, group: List[dict]):
+        """
+        Merges adjacent segments `group` into one, dropping their deleted entries.
+        Only the group's own files are read. Appends and deletes made meanwhile are kept.
+        """
+        files = [s["file"] for s in group]
+        with self.lock:
+            dead = {(t["id"], t["file"]) for t in self.manifest["tombstones"] if t["file"] in files}
+
+        vector_arrays, entries, metric = [], [], None
+        for segment in group:
+            seg_index, seg_entries = self._read_segment(segment["file"])
+            metric = seg_index.metric_type
+            keep = [i for i, (doc_id, _) in enumerate(seg_entries) if (doc_id, segment["file"]) not in dead]
+            if keep:
+                vector_arrays.append(seg_index.reconstruct_n(0, seg_index.ntotal)[keep])
+                entries.extend(seg_entries[i] for i in keep)
+
+        # Reuse the newest merged segment id so later tombstones still apply to it
+        segment_id = group[-1]["id"]
+        name = f"seg-{segment_id:06d}-m{self.manifest['version']}"
+        if entries:
+            self._write_segment(name, np.ascontiguousarray(np.concatenate(vector_arrays), dtype=np.float32), entries, metric)
+
+        with self.lock:
+            manifest = dict(self.manifest)
+            # Deleted while merging: the entry was copied, so its tombstone now targets the merged segment
+            late = [dict(t, file=name) for t in manifest["tombstones"] if t["file"] in files and (t["id"], t["file"]) not in dead]
+            merged = {"id": segment_id, "file": name, "count": len(entries), "deleted": len(late)}
+            position = manifest["segments"].index(next(s for s in manifest["segments"] if s["file"] == files[0]))
+            others = [s for s in manifest["segments"] if s["file"] not in files]
+            manifest["segments"] = others[:position] + ([merged] if entries else []) + others[position:]
+            manifest["tombstones"] = [t for t in manifest["tombstones"] if t["file"] not in files] + (late if entries else [])
+            self._write_manifest(manifest)
+            for doc_id, _ in entries:
+                if self._locations.get(doc_id) in files:
+                    self._locations[doc_id] = name
+
+        for old in files:
+            self._remove_segment_files(old)
+        if os.path.exists(LEGACY_INDEX_PATH):
+            shutil.rmtree(LEGACY_INDEX_PATH, ignore_errors=True)
+        print(f"Compacted FAISS segments {files} into {name} ({len(entries)} vectors)")
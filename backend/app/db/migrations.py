@@ -0,0 +1,16 @@
+import os
+from alembic import command
+from alembic.config import Config
+from app.db.database import engine
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "alembic.ini")
+
+def run_migrations():
+    """
+    Upgrades the database to the latest schema revision (alembic/versions).
+    Databases created before versioned migrations are adopted by the baseline revision.
+    """
+    config = Config(ALEMBIC_INI)
+    with engine.begin() as connection:
+        config.attributes["connection"] = connection
+        command.upgrade(config, "head")
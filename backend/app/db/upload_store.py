@@ -0,0 +1,92 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from typing import BinaryIO, Tuple
+from app.core.config import settings
+from app.services.document_parser import parsed_pages_path
+
+CHUNK_SIZE = 1024 * 1024
+
+class UploadStore:
+    """
+    Content-addressed storage for uploaded documents.
+    Files are stored once per content under <path>/<sha256[:2]>/<sha256><ext>, so uploads
+    with the same name never overwrite each other and identical uploads share one blob.
+    Writes go to a temporary file first and are renamed into place once hashed.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.join(path, "tmp"), exist_ok=True)
+
+    def blob_path(self, file_hash: str, ext: str) -> str:
+        return os.path.join(self.path, file_hash[:2], f"{file_hash}{ext.lower()}")
+
+    def _tmp_path(self) -> str:
+        return os.path.join(self.path, "tmp", uuid.uuid4().hex)
+
+    def _commit(self, tmp_path: str, file_hash: str, ext: str) -> str:
+        path = self.blob_path(file_hash, ext)
+        if os.path.exists(path):
+            os.remove(tmp_path) # Same content already stored
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return path
+
+    # --- Public API ---
+
+    async def save_upload(self, upload, ext: str) -> Tuple[str, str]:
+        """
+        Streams an UploadFile to disk in chunks without blocking the event loop.
+        Returns (sha256, blob path).
+        """
+        digest = hashlib.sha256()
+        tmp_path = self._tmp_path()
+        f = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+        except BaseException:
+            f.close()
+            os.remove(tmp_path)
+            raise
+        await asyncio.to_thread(f.close)
+        file_hash = digest.hexdigest()
+        return file_hash, await asyncio.to_thread(self._commit, tmp_path, file_hash, ext)
+
+    def save_file(self, source: BinaryIO, ext: str) -> Tuple[str, str]:
+        """
+        Blocking variant of save_upload for file-like objects (e.g. zip members).
+        """
+        digest = hashlib.sha256()
+        tmp_path = self._tmp_path()
+        try:
+            with open(tmp_path, "wb") as f:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        file_hash = digest.hexdigest()
+        return file_hash, self._commit(tmp_path, file_hash, ext)
+
+    def delete(self, path: str):
+        """
+        Removes a blob and its derived files. Callers check that no contract references it anymore.
+        """
+        for p in (path, parsed_pages_path(path)):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+upload_store = UploadStore(settings.UPLOAD_STORE_PATH)
@@ -1,17 +1,154 @@
+import asyncio
+import hashlib
 import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_pinecone import PineconeVectorStore
 from langchain_community.vectorstores import FAISS
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import numpy as np
+from langchain_core.documents import Document
 from app.core.config import settings
+from app.db.embedding_executor import EmbeddingExecutor
+from app.db.faiss_segments import FaissSegmentStore
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embedding model wrapper with two caches keyed by model name + text hash:
+    a SQLite store for document embeddings (survives restarts, so re-ingesting known text is free)
+    and an in-memory LRU for query embeddings (the fixed agent queries are embedded once).
+    """
+    def __init__(self, model: Embeddings, model_name: str, path: str, query_cache_size: int, executor: EmbeddingExecutor = None):
+        self.model = model
+        # Document embeddings are computed on the executor's worker threads when one is set
+        self.executor = executor
+        self.model_name = model_name
+        self.query_cache_size = query_cache_size
+        self._queries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        self._conn.commit()
+        self.stats_counters = {"document_hits": 0, "document_misses": 0, "query_hits": 0, "query_misses": 0}
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}|{text}".encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(t) for t in texts]
+        vectors: Dict[str, List[float]] = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                vectors.update((key, np.frombuffer(blob, dtype=np.float32).tolist()) for key, blob in rows)
+
+        missing = list(dict.fromkeys(k for k in keys if k not in vectors))
+        self.stats_counters["document_hits"] += len(keys) - len(missing)
+        self.stats_counters["document_misses"] += len(missing)
+        if missing:
+            text_by_key = dict(zip(keys, texts))
+            missing_texts = [text_by_key[k] for k in missing]
+            computed = self.executor.embed(missing_texts) if self.executor else self.model.embed_documents(missing_texts)
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(k, np.asarray(v, dtype=np.float32).tobytes()) for k, v in zip(missing, computed)]
+                )
+                self._conn.commit()
+            vectors.update(zip(missing, computed))
+        return [list(vectors[k]) for k in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Cache lookups and the wait for the executor happen off the event loop
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds several queries, computing all LRU misses in one batched forward pass.
+        """
+        keys = [self._key(t) for t in texts]
+        with self._lock:
+            cached = {k: self._queries[k] for k in keys if k in self._queries}
+            for k in cached:
+                self._queries.move_to_end(k)
+
+        missing = list(dict.fromkeys(k for k in keys if k not in cached))
+        self.stats_counters["query_hits"] += len(keys) - len(missing)
+        self.stats_counters["query_misses"] += len(missing)
+        if missing:
+            text_by_key = dict(zip(keys, texts))
+            computed = self.model.embed_documents([text_by_key[k] for k in missing])
+            with self._lock:
+                for k, v in zip(missing, computed):
+                    self._queries[k] = v
+                    cached[k] = v
+                while len(self._queries) > self.query_cache_size:
+                    self._queries.popitem(last=False)
+        return [list(cached[k]) for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+    def stats(self) -> dict:
+        c = self.stats_counters
+        doc_total = c["document_hits"] + c["document_misses"]
+        query_total = c["query_hits"] + c["query_misses"]
+        return {
+            **c,
+            "document_hit_rate": round(c["document_hits"] / doc_total, 4) if doc_total else 0.0,
+            "query_hit_rate": round(c["query_hits"] / query_total, 4) if query_total else 0.0,
+            "query_cache_size": len(self._queries),
+        }
 
 class VectorStoreManager:
     def __init__(self):
-        # Initialize Embeddings (Using HuggingFace local model as before)
-        self.embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        self.vector_store = None
+        # Initialize Embeddings (Using HuggingFace local model as before), behind the embedding cache
+        model = HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL)
+        self.embedding_executor = EmbeddingExecutor(
+            model.embed_documents,
+            workers=settings.EMBEDDING_WORKERS,
+            batch_size=settings.EMBEDDING_BATCH_SIZE,
+            max_wait_ms=settings.EMBEDDING_BATCH_WAIT_MS,
+            intra_op_threads=settings.EMBEDDING_INTRA_OP_THREADS
+        )
+        self.embeddings = CachedEmbeddings(
+            model,
+            settings.EMBEDDING_MODEL,
+            settings.EMBEDDING_CACHE_PATH,
+            query_cache_size=settings.QUERY_EMBEDDING_CACHE_SIZE,
+            executor=self.embedding_executor
+        )
+        self._vector_store = None
+        self._loaded = False
+        self.segment_store = None
+        # FAISS only: contract_id -> sorted index positions, so filtered search scales with the contract, not the vault.
+        # Kept in step with adds and deletes instead of being rebuilt.
+        self._contract_positions: Dict[int, np.ndarray] = {}
         self._init_vector_store()
 
+    @property
+    def vector_store(self):
+        # The local FAISS store is loaded from its segments on first use, not at import time
+        if not self._loaded:
+            with self.segment_store.lock:
+                if not self._loaded:
+                    self._vector_store = self.segment_store.load(self.embeddings)
+                    if self._vector_store is not None:
+                        self._rebuild_contract_positions()
+                    self._loaded = True
+        return self._vector_store
+
+    @vector_store.setter
+    def vector_store(self, value):
+        self._vector_store = value
+
     def _init_vector_store(self):
         if settings.PINECONE_API_KEY:
             # Modern LangChain Pinecone usage
@@ -22,30 +159,151 @@ class VectorStoreManager:
                 index_name=settings.PINECONE_INDEX_NAME,
                 embedding=self.embeddings
             )
+            self._loaded = True
         else:
-            # Fallback to local FAISS
-            if os.path.exists("faiss_index"):
-                self.vector_store = FAISS.load_local("faiss_index", self.embeddings, allow_dangerous_deserialization=True)
+            # Fallback to local FAISS, persisted as append-only segments (loaded lazily)
+            self.segment_store = FaissSegmentStore(
+                settings.FAISS_STORE_PATH,
+                merge_factor=settings.FAISS_MERGE_FACTOR,
+                min_segment_size=settings.FAISS_MIN_SEGMENT_SIZE,
+                purge_deleted_ratio=settings.FAISS_PURGE_DELETED_RATIO
+            )
+
+    def _rebuild_contract_positions(self):
+        """
+        Builds the position index from the whole store. Only run on load.
+        """
+        store = self._vector_store
+        positions: Dict[int, List[int]] = {}
+        for position, doc_id in store.index_to_docstore_id.items():
+            doc = store.docstore.search(doc_id)
+            if isinstance(doc, Document) and doc.metadata.get("contract_id") is not None:
+                positions.setdefault(doc.metadata["contract_id"], []).append(position)
+        self._contract_positions = {cid: np.array(sorted(p), dtype=np.int64) for cid, p in positions.items()}
+
+    def _track_positions(self, start: int, metadatas: List[dict]):
+        added: Dict[int, List[int]] = {}
+        for offset, metadata in enumerate(metadatas or []):
+            if metadata.get("contract_id") is not None:
+                added.setdefault(metadata["contract_id"], []).append(start + offset)
+        for contract_id, positions in added.items():
+            # New vectors go after every existing one, so the arrays stay sorted
+            existing = self._contract_positions.get(contract_id, np.empty(0, dtype=np.int64))
+            self._contract_positions[contract_id] = np.concatenate([existing, np.array(positions, dtype=np.int64)])
+
+    def _removed_positions(self, ids: List[str]) -> np.ndarray:
+        """
+        Current positions of `ids`, found through their contracts' position arrays, so the
+        cost scales with the contracts involved rather than the vault. Must hold the store lock.
+        """
+        store = self._vector_store
+        wanted = set(ids)
+        contract_ids = set()
+        for doc_id in ids:
+            doc = store.docstore.search(doc_id)
+            if isinstance(doc, Document) and doc.metadata.get("contract_id") is not None:
+                contract_ids.add(doc.metadata["contract_id"])
+        removed = [
+            int(p) for cid in contract_ids for p in self._contract_positions.get(cid, ())
+            if store.index_to_docstore_id[int(p)] in wanted
+        ]
+        return np.array(sorted(removed), dtype=np.int64)
+
+    def _shift_contract_positions(self, removed: np.ndarray):
+        """
+        Drops deleted positions and moves the later ones down. Deleting compacts the index,
+        so a surviving position moves down by the number of removed positions before it.
+        """
+        for contract_id, positions in list(self._contract_positions.items()):
+            if not len(positions) or positions[-1] < removed[0]:
+                continue
+            positions = positions[~np.isin(positions, removed)]
+            if len(positions):
+                self._contract_positions[contract_id] = positions - np.searchsorted(removed, positions)
             else:
-                self.vector_store = None
+                del self._contract_positions[contract_id]
 
-    def add_texts(self, texts: List[str], metadatas: List[dict] = None):
-        if self.vector_store is None:
-            if settings.PINECONE_API_KEY:
+    def add_texts(self, texts: List[str], metadatas: List[dict] = None, ids: List[str] = None, batch: str = None):
+        """
+        Adds texts to the store. With a `batch` key the local FAISS store holds the new vectors
+        back until commit_batch(batch), so they are persisted together as one segment.
+        """
+        if not texts:
+            return
+        if settings.PINECONE_API_KEY:
+            if self.vector_store is None:
                  # Should have been initted in _init_vector_store but if index was empty/lazy
                  self.vector_store = PineconeVectorStore.from_texts(
                     texts, 
                     self.embeddings, 
+                    metadatas=metadatas,
+                    ids=ids,
                     index_name=settings.PINECONE_INDEX_NAME
                 )
-            else: 
-                self.vector_store = FAISS.from_texts(texts, self.embeddings, metadatas=metadatas)
-        else:
-            self.vector_store.add_texts(texts, metadatas=metadatas)
-        
-        # Save local if using FAISS
+            else:
+                self.vector_store.add_texts(texts, metadatas=metadatas, ids=ids)
+            return
+
+        with self.segment_store.lock:
+            if self.vector_store is None:
+                start = 0
+                self.vector_store = FAISS.from_texts(texts, self.embeddings, metadatas=metadatas, ids=ids)
+            else:
+                start = self.vector_store.index.ntotal
+                self.vector_store.add_texts(texts, metadatas=metadatas, ids=ids)
+            self._track_positions(start, metadatas)
+
+            # Persist only the new vectors as a segment
+            if batch:
+                self.segment_store.stage(batch, self.vector_store, start)
+            else:
+                self.segment_store.append(self.vector_store, start)
+
+    def commit_batch(self, batch: str):
+        """
+        Persists everything added under `batch` as one segment.
+        """
+        if not settings.PINECONE_API_KEY and self.vector_store is not None:
+            self.segment_store.commit(batch, self.vector_store)
+
+    def abort_batch(self, batch: str):
+        """
+        Drops everything added under `batch` without persisting it.
+        """
         if not settings.PINECONE_API_KEY:
-             self.vector_store.save_local("faiss_index") # type: ignore
+            self.delete(self.segment_store.discard(batch))
+
+    async def aadd_texts(self, texts: List[str], metadatas: List[dict] = None, ids: List[str] = None, batch: str = None):
+        """
+        Async variant of add_texts for ingestion: embeddings are computed on the embedding executor
+        (filling the embedding cache), then the store write runs in a thread and hits that cache.
+        """
+        if not texts:
+            return
+        await self.embeddings.aembed_documents(texts)
+        await asyncio.to_thread(self.add_texts, texts, metadatas, ids, batch)
+
+    def delete(self, ids: List[str]):
+        """
+        Removes vectors by id. Unknown ids are ignored.
+        """
+        if not ids or self.vector_store is None:
+            return
+        if settings.PINECONE_API_KEY:
+            self.vector_store.delete(ids=ids)
+        else:
+            with self.segment_store.lock:
+                existing = set(self.vector_store.index_to_docstore_id.values())
+                ids = [i for i in ids if i in existing]
+                if ids:
+                    removed = self._removed_positions(ids)
+                    self.vector_store.delete(ids)
+                    if len(removed) == len(ids):
+                        self._shift_contract_positions(removed)
+                    else:
+                        # Some ids had no contract_id to find them by
+                        self._rebuild_contract_positions()
+                    self.segment_store.delete(ids)
 
     def similarity_search(self, query: str, k: int = 4, filter: dict = None):
         if not self.vector_store:
@@ -53,10 +311,115 @@ class VectorStoreManager:
         if settings.PINECONE_API_KEY:
              return self.vector_store.similarity_search(query, k=k, filter=filter)
         else:
-             # FAISS/Local doesn't support the same dict filter structure easily without more work
-             # For now, just return k results, assuming we might filter post-retrieval or ignoring if using local dev
-             # In a real prod setup with FAISS, we'd need metadata filtering enabled.
-             return self.vector_store.similarity_search(query, k=k)
+             return self._faiss_search_by_vectors([self.embeddings.embed_query(query)], k, filter)[0]
+
+    def similarity_search_batch(self, queries: List[str], k: int = 4, filter: dict = None) -> List[List[Document]]:
+        """
+        Runs several queries at once. All queries are embedded in one batched forward pass,
+        then searched in a single matrix search (FAISS) or concurrently (Pinecone).
+        Returns one result list per query, in the same order.
+        """
+        if not queries:
+            return []
+        if not self.vector_store:
+            return [[] for _ in queries]
+
+        vectors = self.embeddings.embed_queries(queries)
+
+        if settings.PINECONE_API_KEY:
+            def search(vector):
+                hits = self.vector_store.similarity_search_by_vector_with_score(vector, k=k, filter=filter)
+                return [doc for doc, _ in hits]
+
+            with ThreadPoolExecutor(max_workers=min(len(vectors), 8)) as executor:
+                return list(executor.map(search, vectors))
+        else:
+            return self._faiss_search_by_vectors(vectors, k, filter)
+
+    def _faiss_search_by_vectors(self, vectors: List[List[float]], k: int, filter: dict = None) -> List[List[Document]]:
+        import faiss
+
+        matrix = np.array(vectors, dtype=np.float32)
+        # Adds grow and deletes compact the index (shifting positions), possibly in another thread:
+        # positions are resolved to docstore ids, and candidate vectors copied, under the store lock
+        with self.segment_store.lock:
+            store = self.vector_store
+            if getattr(store, "_normalize_L2", False):
+                faiss.normalize_L2(matrix)
+            if filter:
+                candidate_ids, candidates = self._filtered_candidates(filter)
+                metric = store.index.metric_type
+            else:
+                _, indices = store.index.search(matrix, k)
+                id_rows = [[store.index_to_docstore_id[i] for i in row if i != -1] for row in indices]
+
+        if filter:
+            id_rows = self._rank_candidates(matrix, candidate_ids, candidates, metric, k)
+
+        results = []
+        for row in id_rows:
+            docs = []
+            for doc_id in row:
+                doc = store.docstore.search(doc_id)
+                if isinstance(doc, Document): # Deleted since the snapshot
+                    docs.append(doc)
+            results.append(docs)
+        return results
+
+    def _candidate_positions(self, filter: dict) -> np.ndarray:
+        """
+        Index positions matching an equality filter on metadata.
+        contract_id is resolved through the position index; other keys are checked per candidate.
+        Must be called with segment_store.lock held.
+        """
+        store = self.vector_store
+        conditions = dict(filter)
+        if "contract_id" in conditions:
+            positions = self._contract_positions.get(conditions.pop("contract_id"), np.empty(0, dtype=np.int64))
+        else:
+            positions = store.index_to_docstore_id.keys()
+
+        if conditions:
+            def matches(position):
+                doc = store.docstore.search(store.index_to_docstore_id[position])
+                return isinstance(doc, Document) and all(doc.metadata.get(key) == value for key, value in conditions.items())
+            positions = [p for p in positions if matches(p)]
+
+        return np.array(sorted(positions), dtype=np.int64)
+
+    def _filtered_candidates(self, filter: dict):
+        """
+        Snapshot of the vectors matching `filter` and their docstore ids.
+        Only the candidate vectors are reconstructed, so the cost depends on the number of
+        matching chunks rather than the size of the index. Must be called with segment_store.lock held.
+        """
+        positions = self._candidate_positions(filter)
+        if positions.size == 0:
+            return [], None
+        ids = [self.vector_store.index_to_docstore_id[p] for p in positions]
+        return ids, self.vector_store.index.reconstruct_batch(positions)
+
+    @staticmethod
+    def _rank_candidates(matrix: np.ndarray, candidate_ids: List[str], candidates, metric, k: int) -> List[List[str]]:
+        """
+        Exact search over a candidate snapshot. Returns the best k docstore ids per query.
+        """
+        import faiss
+
+        if not candidate_ids:
+            return [[] for _ in range(len(matrix))]
+        if metric == faiss.METRIC_INNER_PRODUCT:
+            distances = -(matrix @ candidates.T)
+        else:
+            # Squared L2 distance, same ranking as IndexFlatL2
+            distances = (
+                (matrix ** 2).sum(axis=1)[:, None]
+                - 2 * (matrix @ candidates.T)
+                + (candidates ** 2).sum(axis=1)[None, :]
+            )
+
+        top = np.argsort(distances, axis=1)[:, :k]
+        return [[candidate_ids[i] for i in row] for row in top]
 
     def as_retriever(self):
         if self.vector_store:
@@ -1,11 +1,13 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.endpoints import router as api_router
-from app.db.database import engine, Base
+from app.db.database import async_engine
+from app.db.migrations import run_migrations
 from app.core.config import settings
-
-# Create tables
-Base.metadata.create_all(bind=engine)
+from app.services.job_queue import job_queue
+from app.services.bulk_upload import bulk_upload_service
+from app.services.alert_service import alert_service
+from app.services.ingestion import ingestion_service
 
 app = FastAPI(title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json")
 
@@ -24,15 +26,36 @@ app.add_middleware(
 
 @app.on_event("startup")
 def startup_event():
-    # Ensure all tables (including new columns) exist or are migrated
-    # For a simple SQLite deployment, we might need to run the migration script if the file exists but columns are missing
-    # But for a fresh "cloud" start with no DB file, `Base.metadata.create_all` works.
-    # If the DB file persists but schema changed, we need the migration script.
-    from migrate_db import migrate
-    try:
-        migrate()
-    except Exception as e:
-        print(f"Migration warning: {e}")
+    # Create or upgrade the schema (alembic migrations; also adopts databases made by create_all)
+    run_migrations()
+
+@app.on_event("startup")
+async def start_job_queue():
+    await job_queue.start()
+
+@app.on_event("startup")
+async def start_alert_sweeper():
+    await alert_service.start()
+
+@app.on_event("startup")
+async def backfill_contract_profiles():
+    ingestion_service.start_profile_backfill()
+
+@app.on_event("shutdown")
+async def stop_alert_sweeper():
+    await alert_service.stop()
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    await job_queue.stop()
+
+@app.on_event("shutdown")
+def stop_bulk_upload():
+    bulk_upload_service.shutdown()
+
+@app.on_event("shutdown")
+async def close_database():
+    await async_engine.dispose()
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum as SqEnum, Float, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum as SqEnum, Float, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -16,31 +16,47 @@ class ContractStatus(str, enum.Enum):
     ANALYZED = "analyzed"
     FAILED = "failed"
 
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
 class Contract(Base):
     __tablename__ = "contracts"
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, index=True)
-    upload_date = Column(DateTime, default=datetime.utcnow)
+    file_hash = Column(String, index=True, nullable=True) # SHA-256 of the uploaded document
+    file_path = Column(String, nullable=True) # Content-addressed blob in the upload store
+    upload_date = Column(DateTime, default=datetime.utcnow, nullable=False) # Keyset pagination key, never NULL
     status = Column(SqEnum(ContractStatus), default=ContractStatus.UPLOADED)
     summary = Column(Text, nullable=True)
     metadata_json = Column(JSON, nullable=True)
 
     # Lifecycle Intelligence
     start_date = Column(DateTime, nullable=True)
-    end_date = Column(DateTime, nullable=True)
+    end_date = Column(DateTime, nullable=True, index=True)
     renewal_terms = Column(Text, nullable=True)
     notice_period_days = Column(Integer, nullable=True)
 
     clauses = relationship("Clause", back_populates="contract", cascade="all, delete-orphan")
     risks = relationship("Risk", back_populates="contract", cascade="all, delete-orphan")
     alerts = relationship("Alert", back_populates="contract", cascade="all, delete-orphan")
+    chunks = relationship("ContractChunk", back_populates="contract", cascade="all, delete-orphan")
+    jobs = relationship("AnalysisJob", back_populates="contract", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index("ix_contracts_upload_date_id", "upload_date", "id"), # Keyset pagination of the contract list
+        Index("ix_contracts_status", "status"), # Analyzed count of the dashboard
+    )
 
 class Clause(Base):
     __tablename__ = "clauses"
 
     id = Column(Integer, primary_key=True, index=True)
-    contract_id = Column(Integer, ForeignKey("contracts.id"))
+    contract_id = Column(Integer, ForeignKey("contracts.id"), index=True)
     category = Column(String, index=True) # e.g., "Termination", "Payment"
     text = Column(Text)
     page_number = Column(Integer, nullable=True)
@@ -51,7 +67,7 @@ class Risk(Base):
     __tablename__ = "risks"
 
     id = Column(Integer, primary_key=True, index=True)
-    contract_id = Column(Integer, ForeignKey("contracts.id"))
+    contract_id = Column(Integer, ForeignKey("contracts.id"), index=True)
     clause_id = Column(Integer, ForeignKey("clauses.id"), nullable=True)
     description = Column(Text)
     risk_level = Column(SqEnum(RiskLevel))
@@ -63,9 +79,63 @@ class Alert(Base):
     __tablename__ = "alerts"
 
     id = Column(Integer, primary_key=True, index=True)
-    contract_id = Column(Integer, ForeignKey("contracts.id"))
+    contract_id = Column(Integer, ForeignKey("contracts.id"), index=True)
     alert_type = Column(String) # e.g., "Renewal", "Termination Deadline"
-    due_date = Column(DateTime)
-    status = Column(String, default="pending") # pending, sent, resolved
+    due_date = Column(DateTime, index=True)
+    status = Column(String, default="pending") # pending, due, sent, resolved
     
     contract = relationship("Contract", back_populates="alerts")
+
+    __table_args__ = (
+        Index("uq_alerts_contract_type", "contract_id", "alert_type", unique=True), # One alert per type and contract
+        Index("ix_alerts_type_due_date", "alert_type", "due_date"),
+    )
+
+class ContractChunk(Base):
+    __tablename__ = "contract_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    contract_id = Column(Integer, ForeignKey("contracts.id"), index=True)
+    chunk_hash = Column(String, index=True) # sha256 of the chunk text
+    vector_id = Column(String, unique=True) # id of the chunk in the vector store
+
+    contract = relationship("Contract", back_populates="chunks")
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    contract_id = Column(Integer, ForeignKey("contracts.id"), index=True)
+    file_path = Column(String)
+    status = Column(SqEnum(JobStatus), default=JobStatus.QUEUED, index=True)
+    priority = Column(Integer, default=0) # Higher runs first
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    next_run_at = Column(DateTime, default=datetime.utcnow) # Earliest time the job may (re)start
+    progress = Column(JSON, nullable=True) # Completed pipeline steps
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    locked_by = Column(String, nullable=True) # Worker process running the job
+    heartbeat_at = Column(DateTime, nullable=True, index=True) # Renewed while running; a stale heartbeat means the lease expired
+
+    contract = relationship("Contract", back_populates="jobs")
+
+# Materialized portfolio counters, updated incrementally (see app/services/portfolio_stats.py)
+class PortfolioStat(Base):
+    __tablename__ = "portfolio_stats"
+
+    dimension = Column(String, primary_key=True) # "contracts" (total), "risk_level", "clause_category" or "expiry"
+    bucket = Column(String, primary_key=True) # e.g. "high", "Termination", or an ISO end date for "expiry"
+    value = Column(Integer, default=0)
+
+# Cached comparison results keyed by both contracts' clause sets (see app/services/compare_service.py)
+class ContractComparison(Base):
+    __tablename__ = "contract_comparisons"
+
+    key = Column(String, primary_key=True) # sha256 of the baseline's and the other contract's clause-set hashes
+    contract_id_1 = Column(Integer, ForeignKey("contracts.id"), index=True) # Baseline (Contract A)
+    contract_id_2 = Column(Integer, ForeignKey("contracts.id"), index=True)
+    result = Column(JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
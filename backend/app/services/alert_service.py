@@ -0,0 +1,123 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.models.db import Alert, Contract
+
+EXPIRATION = "Contract Expiration"
+NOTICE_DEADLINE = "Termination Notice Deadline"
+
+PENDING = "pending"
+DUE = "due"
+
+class AlertService:
+    """
+    Lifecycle alerts: one alert per (contract, alert type), derived from the contract's
+    end date and notice period, plus a sweeper that marks pending alerts as due once their
+    date has passed, with a single UPDATE per run.
+    """
+    def __init__(self, sweep_interval_seconds: float):
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    # --- Public API ---
+
+    @staticmethod
+    def expected_alerts(contract: Contract) -> Dict[str, datetime]:
+        alerts: Dict[str, datetime] = {}
+        if contract.end_date:
+            alerts[EXPIRATION] = contract.end_date
+            if contract.notice_period_days:
+                alerts[NOTICE_DEADLINE] = contract.end_date - timedelta(days=contract.notice_period_days)
+        return alerts
+
+    async def sync_contract_alerts(self, db: AsyncSession, contract: Contract):
+        """
+        Upserts a contract's alerts so re-analysis never duplicates them: existing alerts are
+        kept (with their status) while their date is unchanged, moved and reset to pending when
+        it changed, and removed when they no longer apply. Does not commit.
+        """
+        expected = self.expected_alerts(contract)
+        existing = {
+            alert.alert_type: alert
+            for alert in await db.scalars(select(Alert).where(Alert.contract_id == contract.id))
+        }
+
+        for alert_type, alert in existing.items():
+            if alert_type not in expected:
+                await db.delete(alert)
+        for alert_type, due_date in expected.items():
+            alert = existing.get(alert_type)
+            if alert is None:
+                db.add(Alert(contract_id=contract.id, alert_type=alert_type, due_date=due_date, status=PENDING))
+            elif alert.due_date != due_date:
+                alert.due_date = due_date
+                alert.status = PENDING
+
+    @staticmethod
+    async def list_alerts(
+        db: AsyncSession,
+        within_days: int = 30,
+        alert_type: Optional[str] = None,
+        status: Optional[str] = None,
+        include_overdue: bool = False,
+        limit: int = 100
+    ) -> List[dict]:
+        """
+        Alerts due in the next `within_days` days (optionally also overdue ones), soonest first.
+        A range scan on the (alert_type, due_date) or due_date index.
+        """
+        now = datetime.utcnow()
+        query = select(
+            Alert.id, Alert.contract_id, Contract.filename, Alert.alert_type, Alert.due_date, Alert.status
+        ).join(Contract, Contract.id == Alert.contract_id)
+        query = query.where(Alert.due_date <= now + timedelta(days=within_days))
+        if not include_overdue:
+            query = query.where(Alert.due_date >= now)
+        if alert_type:
+            query = query.where(Alert.alert_type == alert_type)
+        if status:
+            query = query.where(Alert.status == status)
+
+        rows = await db.execute(query.order_by(Alert.due_date.asc(), Alert.id.asc()).limit(max(1, min(limit, 1000))))
+        return [dict(row) for row in rows.mappings()]
+
+    @staticmethod
+    async def sweep(db: AsyncSession) -> int:
+        """
+        Marks every pending alert whose date has passed as due. Returns how many changed.
+        """
+        result = await db.execute(
+            update(Alert)
+            .where(Alert.status == PENDING, Alert.due_date <= datetime.utcnow())
+            .values(status=DUE)
+        )
+        await db.commit()
+        return result.rowcount or 0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # --- Scheduler ---
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    marked = await self.sweep(db)
+                if marked:
+                    print(f"Marked {marked} alerts as due")
+            except Exception as e:
+                print(f"Alert sweep error: {e}")
+            await asyncio.sleep(self.sweep_interval_seconds)
+
+alert_service = AlertService(sweep_interval_seconds=settings.ALERT_SWEEP_INTERVAL_SECONDS)
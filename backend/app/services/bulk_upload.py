@@ -0,0 +1,221 @@
+import asyncio
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi import UploadFile
+from app.core.config import settings
+from sqlalchemy import select
+from app.db.database import AsyncSessionLocal
+from app.db.upload_store import upload_store
+from app.models.db import Contract, ContractStatus
+from app.services.document_parser import SUPPORTED_EXTENSIONS, parse_to_sidecar
+from app.services.job_queue import job_queue
+from app.services.portfolio_stats import TOTAL, portfolio_stats_service
+from app.services.upload_service import upload_service
+
+class BulkUploadService:
+    """
+    Ingests many contracts at once (several files and/or zip archives).
+    Documents are parsed in a process pool, so large batches use every core without blocking
+    the event loop; the parsed pages are kept next to each file for ingestion to reuse.
+    Analyses are queued as documents finish parsing, but only while fewer than
+    `max_pending_jobs` are queued or running, so a large batch cannot flood the job queue.
+    """
+    def __init__(self, parse_workers: int, max_pending_jobs: int):
+        self.parse_workers = max(1, parse_workers)
+        self.max_pending_jobs = max(1, max_pending_jobs)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking would copy the model and index threads of this process
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.parse_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    # --- Public API ---
+
+    async def save_uploads(self, files: List[UploadFile]) -> Tuple[List[dict], List[dict]]:
+        """
+        Streams uploaded files into the upload store, extracting zip archives.
+        Returns the saved files ({"filename", "file_hash", "path"}) and the rejected files with their reason.
+        """
+        saved: List[dict] = []
+        rejected: List[dict] = []
+        for upload in files:
+            filename = os.path.basename(upload.filename or "")
+            ext = os.path.splitext(filename)[1].lower()
+            if ext == ".zip":
+                try:
+                    extracted, skipped = await asyncio.to_thread(self._extract_zip, upload.file)
+                    saved.extend(extracted)
+                    rejected.extend(skipped)
+                except zipfile.BadZipFile:
+                    rejected.append({"filename": filename, "error": "Invalid zip archive"})
+            elif ext in SUPPORTED_EXTENSIONS:
+                file_hash, path = await upload_store.save_upload(upload, ext)
+                saved.append({"filename": filename, "file_hash": file_hash, "path": path})
+            else:
+                rejected.append({"filename": filename, "error": f"Unsupported file type: {ext or 'none'}"})
+        return saved, rejected
+
+    async def create_contracts(self, files: List[dict], priority: int = 0) -> Tuple[List[dict], List[dict]]:
+        """
+        Creates the Contract rows of a batch in a single transaction.
+        Files already uploaded before (or earlier in the batch) are linked to the existing
+        contract instead. Returns the new entries and the duplicates.
+        """
+        async with AsyncSessionLocal() as db:
+            known: Dict[str, Contract] = {
+                c.file_hash: c for c in await db.scalars(
+                    select(Contract)
+                    .where(Contract.file_hash.in_({f["file_hash"] for f in files}))
+                    .order_by(Contract.id.desc())
+                )
+            }
+            new: List[Tuple[dict, Contract]] = []
+            duplicates: List[dict] = []
+            for f in files:
+                existing = known.get(f["file_hash"])
+                if existing is not None:
+                    duplicates.append({"filename": f["filename"], "existing": existing})
+                    continue
+                contract = Contract(
+                    filename=f["filename"],
+                    file_hash=f["file_hash"],
+                    file_path=f["path"],
+                    status=ContractStatus.UPLOADED
+                )
+                known[f["file_hash"]] = contract
+                new.append((f, contract))
+            db.add_all([contract for _, contract in new])
+            await portfolio_stats_service.apply(db, {TOTAL: len(new)})
+            await db.commit()
+
+            linked = []
+            for d in duplicates:
+                existing = d["existing"]
+                job = await upload_service.reuse(db, existing, priority=priority)
+                linked.append({
+                    "filename": d["filename"],
+                    "contract_id": existing.id,
+                    "duplicate_of": existing.id,
+                    "status": existing.status.value,
+                    "job_id": job.id if job else None
+                })
+            entries = [
+                {"contract_id": contract.id, "filename": f["filename"], "path": f["path"]}
+                for f, contract in new
+            ]
+            return entries, linked
+
+    def start(self, entries: List[dict], priority: int = 0) -> asyncio.Queue:
+        """
+        Parses and queues the analysis of a batch in the background.
+        Returns a queue of ("file", status) events, ended by None. The batch keeps going
+        if nobody consumes the events (e.g. the client disconnected).
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self._process(entries, priority, events))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return events
+
+    def shutdown(self):
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    # --- Internals ---
+
+    async def _process(self, entries: List[dict], priority: int, events: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        pool = self._executor()
+
+        async def parse(entry: dict):
+            try:
+                return entry, await loop.run_in_executor(pool, parse_to_sidecar, entry["path"]), None
+            except Exception as e:
+                return entry, None, e
+
+        try:
+            for done in asyncio.as_completed([parse(entry) for entry in entries]):
+                entry, info, error = await done
+                status = {"contract_id": entry["contract_id"], "filename": entry["filename"]}
+                if error is not None:
+                    if await self._mark_failed(entry["contract_id"]):
+                        events.put_nowait(("file", {**status, "status": "failed", "error": str(error)}))
+                    continue
+                events.put_nowait(("file", {**status, "status": "parsed", **info}))
+
+                # Backpressure: wait for the job queue to drain before adding more work
+                while await self._pending_jobs() >= self.max_pending_jobs:
+                    await asyncio.sleep(job_queue.poll_interval_seconds)
+
+                job_id = await self._enqueue(entry, priority)
+                if job_id is not None:
+                    events.put_nowait(("file", {**status, "status": "queued", "job_id": job_id}))
+        except Exception as e:
+            print(f"Bulk upload error: {e}")
+            events.put_nowait(("error", {"message": str(e)}))
+        finally:
+            events.put_nowait(None)
+
+    # A batch can take hours to drain, so each step uses its own short session
+    # instead of holding one (and its connection) for the whole batch
+
+    @staticmethod
+    async def _pending_jobs() -> int:
+        async with AsyncSessionLocal() as db:
+            return await job_queue.pending_count(db)
+
+    @staticmethod
+    async def _mark_failed(contract_id: int) -> bool:
+        async with AsyncSessionLocal() as db:
+            contract = await db.get(Contract, contract_id)
+            if contract is None:
+                return False # Deleted while parsing
+            contract.status = ContractStatus.FAILED
+            await db.commit()
+            return True
+
+    @staticmethod
+    async def _enqueue(entry: dict, priority: int) -> Optional[int]:
+        async with AsyncSessionLocal() as db:
+            contract = await db.get(Contract, entry["contract_id"])
+            if contract is None:
+                return None # Deleted while parsing
+            job = await job_queue.enqueue(db, contract.id, entry["path"], priority=priority)
+            contract.status = ContractStatus.PROCESSING
+            await db.commit()
+            return job.id
+
+    @staticmethod
+    def _extract_zip(source) -> Tuple[List[dict], List[dict]]:
+        saved, rejected = [], []
+        with zipfile.ZipFile(source) as archive:
+            for member in archive.infolist():
+                if member.is_dir():
+                    continue
+                # Archive folders are dropped; only the base name is kept for display
+                filename = os.path.basename(member.filename)
+                ext = os.path.splitext(filename)[1].lower()
+                if not filename or filename.startswith("."):
+                    continue
+                if ext not in SUPPORTED_EXTENSIONS:
+                    rejected.append({"filename": filename, "error": f"Unsupported file type: {ext or 'none'}"})
+                    continue
+                with archive.open(member) as member_file:
+                    file_hash, path = upload_store.save_file(member_file, ext)
+                saved.append({"filename": filename, "file_hash": file_hash, "path": path})
+        return saved, rejected
+
+bulk_upload_service = BulkUploadService(
+    parse_workers=settings.BULK_PARSE_WORKERS,
+    max_pending_jobs=settings.BULK_MAX_PENDING_JOBS
+)
@@ -1,38 +1,253 @@
-from app.core.llm import get_llm
-from app.models.db import Contract
-from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.llm import get_llm, parse_json_response
+from app.db.database import AsyncSessionLocal
+from app.models.db import Contract, ContractComparison
+from sqlalchemy import delete, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from langchain_core.messages import HumanMessage
+from typing import AsyncIterator, Dict, List, Tuple
+import asyncio
+import hashlib
 import json
+import re
+
+NOT_SPECIFIED = "Not specified in the contract."
+_WHITESPACE = re.compile(r"\s+")
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text or "").strip().casefold()
+
+class ClauseGroups:
+    """
+    A contract's extracted clauses grouped by category, plus a hash of the whole clause set.
+    Built once per contract and reusable across comparisons; formatted prompt sections are
+    memoized, so a benchmark baseline is formatted once for all of its comparisons.
+    """
+    def __init__(self, contract: Contract):
+        self.contract_id = contract.id
+        self.filename = contract.filename
+        self._formatted: Dict[str, str] = {}
+        # normalized category -> {"label": first spelling seen, "texts": [clause texts]}
+        self.categories: Dict[str, dict] = {}
+        for clause in contract.clauses:
+            label = (clause.category or "Uncategorized").strip()
+            group = self.categories.setdefault(_normalize(label), {"label": label, "texts": []})
+            group["texts"].append(clause.text or "")
+
+        canonical = sorted((key, _normalize(text)) for key, g in self.categories.items() for text in g["texts"])
+        self.hash = hashlib.sha256(json.dumps(canonical).encode("utf-8")).hexdigest()
+
+    def normalized_texts(self, key: str) -> List[str]:
+        return sorted(_normalize(t) for t in self.categories[key]["texts"])
+
+    def formatted(self, key: str) -> str:
+        if key not in self._formatted:
+            self._formatted[key] = "\n".join(f"  - {t}" for t in self.categories[key]["texts"])
+        return self._formatted[key]
 
 class CompareService:
+    """
+    Compares two contracts' extracted clauses.
+    Clauses are aligned by category first: categories with identical text are skipped and
+    categories present in only one contract are reported without the LLM, so only categories
+    that really differ are sent to it. Results are cached per pair of clause sets in the
+    contract_comparisons table and invalidated when either contract is re-analyzed.
+    """
     def __init__(self):
         self.llm = get_llm(temperature=0.0)
 
-    async def compare_contracts(self, contract1_id: int, contract2_id: int, db: Session) -> dict:
-        from sqlalchemy.orm import selectinload
-        
-        # Eager load clauses to ensure factual grounding
-        c1 = db.query(Contract).options(selectinload(Contract.clauses)).filter(Contract.id == contract1_id).first()
-        c2 = db.query(Contract).options(selectinload(Contract.clauses)).filter(Contract.id == contract2_id).first()
-        
-        if not c1 or not c2:
+    # --- Public API ---
+
+    async def compare_contracts(self, contract1_id: int, contract2_id: int, db: AsyncSession) -> dict:
+        groups = await self.load_groups(db, [contract1_id, contract2_id])
+        if contract1_id not in groups or contract2_id not in groups:
             raise ValueError("One or both contracts not found")
 
-        # Helper to format clauses for context
-        def format_contract_data(contract):
-            clauses_str = "\n".join([f"- {c.category}: {c.text}" for c in contract.clauses]) if contract.clauses else "No detailed clauses extracted."
+        return await self.compare_groups(groups[contract1_id], groups[contract2_id], db)
+
+    @staticmethod
+    async def load_groups(db: AsyncSession, contract_ids: List[int]) -> Dict[int, ClauseGroups]:
+        """
+        Loads the contracts and their clauses (two queries however many ids) as ClauseGroups.
+        """
+        # Eager load clauses to ensure factual grounding
+        contracts = await db.scalars(
+            select(Contract).options(selectinload(Contract.clauses)).where(Contract.id.in_(contract_ids))
+        )
+        return {c.id: ClauseGroups(c) for c in contracts}
+
+    async def compare_groups(self, a: ClauseGroups, b: ClauseGroups, db: AsyncSession) -> dict:
+        """
+        Compares two prepared clause sets (A is the baseline), using the cache when possible.
+        """
+        key = self.cache_key(a, b)
+        cached = await db.get(ContractComparison, key)
+        if cached:
+            return cached.result
+
+        result = await self._compare(a, b)
+        await self._store(db, key, a, b, result)
+        return result
+
+    async def benchmark(self, baseline: ClauseGroups, others: List[ClauseGroups]) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        Compares many contracts against one baseline, yielding a ("comparison", {...}) event per
+        contract as soon as its result is ready. Cached results come first; the rest run
+        concurrently, at most COMPARE_MAX_CONCURRENCY at a time, so the total time is close to
+        that of the slowest comparisons rather than their sum.
+        Uses its own session, since it outlives the request's.
+        """
+        keys = {g.contract_id: self.cache_key(baseline, g) for g in others}
+        async with AsyncSessionLocal() as db:
+            cached = {
+                row.key: row.result for row in await db.scalars(
+                    select(ContractComparison).where(ContractComparison.key.in_(set(keys.values())))
+                )
+            }
+            pending = []
+            for g in others:
+                if keys[g.contract_id] in cached:
+                    yield "comparison", self._benchmark_item(g, cached[keys[g.contract_id]], cached=True)
+                else:
+                    pending.append(g)
+
+            semaphore = asyncio.Semaphore(max(1, settings.COMPARE_MAX_CONCURRENCY))
+
+            async def run(g: ClauseGroups):
+                async with semaphore:
+                    return g, await self._compare(baseline, g)
+
+            tasks = [asyncio.create_task(run(g)) for g in pending]
+            try:
+                for done in asyncio.as_completed(tasks):
+                    g, result = await done
+                    await self._store(db, keys[g.contract_id], baseline, g, result)
+                    yield "comparison", self._benchmark_item(g, result, cached=False)
+            finally:
+                # The client went away: stop the remaining comparisons
+                for task in tasks:
+                    task.cancel()
+
+    @staticmethod
+    def cache_key(a: ClauseGroups, b: ClauseGroups) -> str:
+        # Direction matters: A is the baseline
+        return hashlib.sha256(f"{a.hash}|{b.hash}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    async def invalidate(db: AsyncSession, contract_id: int):
+        """
+        Drops cached comparisons involving a contract. Does not commit.
+        """
+        await db.execute(delete(ContractComparison).where(or_(
+            ContractComparison.contract_id_1 == contract_id,
+            ContractComparison.contract_id_2 == contract_id
+        )))
+
+    @staticmethod
+    def pre_diff(a: ClauseGroups, b: ClauseGroups) -> dict:
+        """
+        Aligns clauses by category. Returns the categories that differ (for the LLM),
+        deterministic entries for categories only one contract has, and the identical categories.
+        """
+        differing, one_sided, identical = [], [], []
+        for key in list(a.categories) + [k for k in b.categories if k not in a.categories]:
+            in_a, in_b = a.categories.get(key), b.categories.get(key)
+            label = (in_a or in_b)["label"]
+            if in_a and in_b:
+                if a.normalized_texts(key) == b.normalized_texts(key):
+                    identical.append(label)
+                else:
+                    differing.append({"key": key, "category": label})
+            else:
+                one_sided.append({
+                    "category": label,
+                    "contract_a_point": " ".join(in_a["texts"]) if in_a else NOT_SPECIFIED,
+                    "contract_b_point": " ".join(in_b["texts"]) if in_b else NOT_SPECIFIED,
+                    "assessment": f"Only Contract {'A' if in_a else 'B'} specifies a {label} clause."
+                })
+        return {"differing": differing, "one_sided": one_sided, "identical": identical}
+
+    # --- Internals ---
+
+    @staticmethod
+    async def _store(db: AsyncSession, key: str, a: ClauseGroups, b: ClauseGroups, result: dict):
+        if result.get("error"):
+            return # Never cache failures
+        db.add(ContractComparison(key=key, contract_id_1=a.contract_id, contract_id_2=b.contract_id, result=result))
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback() # Stored concurrently by another request
+
+    @staticmethod
+    def _benchmark_item(g: ClauseGroups, result: dict, cached: bool) -> dict:
+        return {"contract_id": g.contract_id, "filename": g.filename, "cached": cached, "result": result}
+
+    async def _compare(self, a: ClauseGroups, b: ClauseGroups) -> dict:
+        diff = self.pre_diff(a, b)
+        result = {
+            "overview_diff": "",
+            "key_differences": [],
+            "recommendation": "",
+            "identical_categories": diff["identical"],
+        }
+
+        if not diff["differing"]:
+            # Nothing for the LLM to judge
+            result["key_differences"] = diff["one_sided"]
+            result["overview_diff"] = self._deterministic_overview(diff)
+            result["recommendation"] = (
+                "Review the clauses that appear in only one contract: "
+                + ", ".join(d["category"] for d in diff["one_sided"]) + "."
+                if diff["one_sided"] else "No differences found in the extracted clauses."
+            )
+            return result
+
+        try:
+            llm_result = await self._llm_compare(a, b, diff)
+            result["overview_diff"] = llm_result.get("overview_diff", "")
+            result["key_differences"] = list(llm_result.get("key_differences", [])) + diff["one_sided"]
+            result["recommendation"] = llm_result.get("recommendation", "")
+            return result
+        except Exception as e:
+            return {
+                "overview_diff": "Error processing comparison.",
+                "key_differences": [],
+                "recommendation": str(e),
+                "error": True
+            }
+
+    @staticmethod
+    def _deterministic_overview(diff: dict) -> str:
+        parts = []
+        if diff["identical"]:
+            parts.append(f"Both contracts have identical extracted clauses for: {', '.join(diff['identical'])}.")
+        if diff["one_sided"]:
+            parts.append(f"Clauses present in only one contract: {', '.join(d['category'] for d in diff['one_sided'])}.")
+        return " ".join(parts) or "No clauses were extracted from either contract."
+
+    async def _llm_compare(self, a: ClauseGroups, b: ClauseGroups, diff: dict) -> dict:
+        def format_category(d):
             return f"""
-            Filename: {contract.filename}
-            EXTRACTED CLAUSES:
-            {clauses_str}
+            CATEGORY: {d['category']}
+            CONTRACT A:
+            {a.formatted(d['key'])}
+            CONTRACT B:
+            {b.formatted(d['key'])}
             """
 
+        # Neutral labels only: results are cached by clause sets, which copies of one template share
         context = f"""
-        CONTRACT A (Baseline):
-        {format_contract_data(c1)}
-        
-        CONTRACT B (Comparison):
-        {format_contract_data(c2)}
+        CONTRACT A: Baseline
+        CONTRACT B: Comparison
+
+        DIFFERING CLAUSES BY CATEGORY:
+        {"".join(format_category(d) for d in diff["differing"])}
+
+        Already verified as identical in both contracts: {", ".join(diff["identical"]) or "none"}
+        Present in only one contract (handled separately): {", ".join(d["category"] for d in diff["one_sided"]) or "none"}
         """
 
         prompt = f"""
@@ -55,9 +270,10 @@ class CompareService:
         The system must prefer saying “information not available” over speculative reasoning.
 
         GOAL: Compare Contract A and Contract B based strictly on the provided EXTRACTED CLAUSES.
+        Only the categories whose clauses differ are listed; return one key difference per listed category.
 
         {context}
-        
+
         Return a JSON response with the following structure:
         {{
             "overview_diff": "A short paragraph explaining the main factual differences founded in the text.",
@@ -72,22 +288,8 @@ class CompareService:
             "recommendation": "Recommendation based ONLY on the extracted facts."
         }}
         """
-        
-        try:
-            response = await self.llm.ainvoke([HumanMessage(content=prompt)])
-            content = response.content.strip()
-            
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0]
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0]
-                
-            return json.loads(content)
-        except Exception as e:
-            return {
-                "overview_diff": "Error processing comparison.",
-                "key_differences": [],
-                "recommendation": str(e)
-            }
+
+        response = await self.llm.ainvoke([HumanMessage(content=prompt)], validate=parse_json_response)
+        return parse_json_response(response.content)
 
 compare_service = CompareService()
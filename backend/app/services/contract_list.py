@@ -0,0 +1,93 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import and_, exists, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.db import Contract, ContractStatus, Risk, RiskLevel
+
+# Columns a list item may contain; summary and metadata_json are never loaded here
+LIST_FIELDS = {
+    "id": Contract.id,
+    "filename": Contract.filename,
+    "upload_date": Contract.upload_date,
+    "status": Contract.status,
+    "start_date": Contract.start_date,
+    "end_date": Contract.end_date,
+    "notice_period_days": Contract.notice_period_days,
+}
+DEFAULT_FIELDS = ("id", "filename", "upload_date", "status", "end_date")
+MAX_LIMIT = 100
+
+class ContractListService:
+    """
+    Paginated contract listing with keyset pagination on (upload_date, id), newest first.
+    The cursor is the position of the last item returned, so every page is an index range
+    scan however deep the client pages, and concurrent uploads do not shift pages.
+    """
+
+    @staticmethod
+    def encode_cursor(upload_date: datetime, contract_id: int) -> str:
+        raw = json.dumps([upload_date.isoformat(), contract_id])
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def decode_cursor(cursor: str):
+        try:
+            upload_date, contract_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            return datetime.fromisoformat(upload_date), int(contract_id)
+        except Exception:
+            raise ValueError("Invalid cursor")
+
+    @staticmethod
+    def parse_fields(fields: Optional[str]) -> List[str]:
+        if not fields:
+            return list(DEFAULT_FIELDS)
+        names = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in names if f not in LIST_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(LIST_FIELDS)}")
+        # id and upload_date are needed for the cursor
+        return list(dict.fromkeys(["id", "upload_date"] + names))
+
+    async def list_contracts(
+        self,
+        db: AsyncSession,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        fields: Optional[str] = None,
+        status: Optional[ContractStatus] = None,
+        risk_level: Optional[RiskLevel] = None,
+        expires_within_days: Optional[int] = None
+    ) -> dict:
+        names = self.parse_fields(fields)
+        limit = max(1, min(limit, MAX_LIMIT))
+
+        query = select(*[LIST_FIELDS[name] for name in names])
+        if status:
+            query = query.where(Contract.status == status)
+        if risk_level:
+            query = query.where(exists().where(Risk.contract_id == Contract.id, Risk.risk_level == risk_level))
+        if expires_within_days is not None:
+            now = datetime.utcnow()
+            query = query.where(Contract.end_date > now, Contract.end_date <= now + timedelta(days=expires_within_days))
+        if cursor:
+            upload_date, contract_id = self.decode_cursor(cursor)
+            query = query.where(or_(
+                Contract.upload_date < upload_date,
+                and_(Contract.upload_date == upload_date, Contract.id < contract_id)
+            ))
+
+        # One extra row tells whether there is a next page
+        rows = (await db.execute(
+            query.order_by(Contract.upload_date.desc(), Contract.id.desc()).limit(limit + 1)
+        )).mappings().all()
+
+        items = [{name: row[name] for name in names} for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = self.encode_cursor(last["upload_date"], last["id"])
+        return {"items": items, "next_cursor": next_cursor}
+
+contract_list_service = ContractListService()
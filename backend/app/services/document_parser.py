@@ -0,0 +1,54 @@
+import json
+import os
+from typing import Iterator
+from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
+from langchain_core.documents import Document
+
+# Kept free of app.db / model imports so process-pool workers start cheaply
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx")
+
+def get_loader(file_path: str):
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".pdf":
+        return PyPDFLoader(file_path)
+    elif ext == ".docx":
+        return Docx2txtLoader(file_path)
+    raise ValueError(f"Unsupported file type: {ext}")
+
+def parsed_pages_path(file_path: str) -> str:
+    return f"{file_path}.pages.jsonl"
+
+def parse_to_sidecar(file_path: str) -> dict:
+    """
+    Parses a document page by page into a JSONL sidecar next to it, so ingestion can stream
+    the extracted pages instead of parsing the file again. Meant to run in a process pool.
+    Returns page and character counts.
+    """
+    target = parsed_pages_path(file_path)
+    tmp_target = f"{target}.tmp"
+    pages = 0
+    characters = 0
+    with open(tmp_target, "w", encoding="utf-8") as f:
+        for page in get_loader(file_path).lazy_load():
+            f.write(json.dumps({"page_content": page.page_content, "metadata": page.metadata}) + "\n")
+            pages += 1
+            characters += len(page.page_content)
+    os.replace(tmp_target, target)
+
+    if not characters:
+        raise ValueError("No extractable text (scanned or empty document)")
+    return {"pages": pages, "characters": characters}
+
+def load_pages(file_path: str) -> Iterator[Document]:
+    """
+    Lazily yields the pages of a document, from its parsed sidecar when one is up to date.
+    """
+    sidecar = parsed_pages_path(file_path)
+    if os.path.exists(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(file_path):
+        with open(sidecar, encoding="utf-8") as f:
+            for line in f:
+                data = json.loads(line)
+                yield Document(page_content=data["page_content"], metadata=data["metadata"])
+        return
+    yield from get_loader(file_path).lazy_load()
@@ -1,47 +1,267 @@
+import asyncio
+import hashlib
 import os
-from typing import List, Optional
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
+import threading
+import uuid
+from typing import Dict, Iterator, List, Optional
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
+from app.core.config import settings
+from app.db.bm25_index import bm25_index
+from sqlalchemy import delete, select
+from sqlalchemy.orm import selectinload
+from app.db.contract_index import contract_index
+from app.db.database import AsyncSessionLocal
 from app.db.vector_store import vector_store_manager
+from app.models.db import Contract, ContractChunk, ContractStatus
+from app.services.document_parser import get_loader, load_pages
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+PROFILE_CLAUSE_CHARS = 300 # Leading characters of each clause included in a contract profile
 
 class IngestionService:
     def __init__(self):
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", " ", ""]
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            separators=["\n\n", "\n", " ", ""],
+            add_start_index=True # Lets the context packer merge overlapping chunks
         )
+        self._backfill_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def hash_chunk(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def iter_chunks(self, file_path: str, contract_id: int, filename: Optional[str] = None) -> Iterator[Document]:
+        """
+        Lazily loads the file page by page (from its parsed sidecar if present) and yields its chunks.
+        The tail of each page is carried into the next one so chunks overlap across page boundaries.
+        Chunks record the 1-based page_number they belong to, and `filename` (the name the contract
+        was uploaded as; stored files are named by content hash) as their source.
+        """
+        carry = ""
+        for page in load_pages(file_path):
+            page_index = page.metadata.get("page")
 
-    async def ingest_file(self, file_path: str, contract_id: int) -> int:
+            metadata = dict(page.metadata)
+            metadata["contract_id"] = contract_id
+            metadata["source"] = filename or os.path.basename(file_path)
+            metadata["page_number"] = page_index + 1 if isinstance(page_index, int) else None
+
+            page_doc = Document(page_content=carry + page.page_content, metadata=metadata)
+            for chunk in self.text_splitter.split_documents([page_doc]):
+                # Offsets are relative to the page itself; negative means the chunk starts on the previous page
+                chunk.metadata["start_index"] = chunk.metadata.get("start_index", 0) - len(carry)
+                yield chunk
+
+            if page.page_content:
+                carry = page.page_content[-CHUNK_OVERLAP:]
+
+    async def ingest_file(self, file_path: str, contract_id: int, filename: Optional[str] = None) -> int:
         """
         Ingests a file, chunks it, and stores it in the vector store.
-        Returns the number of chunks created.
-        """
-        ext = os.path.splitext(file_path)[1].lower()
-        
-        if ext == ".pdf":
-            loader = PyPDFLoader(file_path)
-            documents = loader.load()
-        elif ext == ".docx":
-            loader = Docx2txtLoader(file_path)
-            documents = loader.load()
-        else:
-            raise ValueError(f"Unsupported file type: {ext}")
-            
-        # Add metadata
-        for doc in documents:
-            doc.metadata["contract_id"] = contract_id
-            doc.metadata["source"] = os.path.basename(file_path)
-            
-        chunks = self.text_splitter.split_documents(documents)
-        
-        # Store in Vector DB
-        texts = [c.page_content for c in chunks]
-        metadatas = [c.metadata for c in chunks]
-        
-        vector_store_manager.add_texts(texts, metadatas)
-        
-        return len(chunks)
+        Pages are parsed lazily in a worker thread while earlier batches of INGEST_BATCH_SIZE chunks
+        are embedded and upserted, so memory stays bounded and chunks become searchable as they go.
+        Ingestion is idempotent: chunks are content-hashed, only chunks not yet stored for
+        the contract are embedded, and chunks no longer in the file are removed.
+        New vectors are persisted as one segment for the whole contract and registered in the
+        chunk registry only once that segment is written; a failed ingestion persists nothing.
+        Returns the number of chunks in the document.
+        """
+        # Fail fast on unsupported files before touching the stores
+        get_loader(file_path)
+
+        async with AsyncSessionLocal() as db:
+            rows = await db.execute(
+                select(ContractChunk.chunk_hash, ContractChunk.vector_id).where(ContractChunk.contract_id == contract_id)
+            )
+            existing: Dict[str, str] = {chunk_hash: vector_id for chunk_hash, vector_id in rows}
+            seen = set()
+            added: Dict[str, str] = {} # vector_id -> chunk_hash of the chunks stored by this ingestion
+            batch_key = f"contract-{contract_id}-{uuid.uuid4().hex}"
+            counts = {"chunks": 0}
+
+            # Bounded hand-off between the parser thread (producer) and the upserts (consumer)
+            batches: asyncio.Queue = asyncio.Queue(maxsize=2)
+            loop = asyncio.get_running_loop()
+            stop = threading.Event()
+
+            def put(item):
+                asyncio.run_coroutine_threadsafe(batches.put(item), loop).result()
+
+            def parse():
+                batch: List[Document] = []
+                try:
+                    for chunk in self.iter_chunks(file_path, contract_id, filename):
+                        if stop.is_set():
+                            return
+                        batch.append(chunk)
+                        if len(batch) >= settings.INGEST_BATCH_SIZE:
+                            put(batch)
+                            batch = []
+                    if batch:
+                        put(batch)
+                finally:
+                    put(None)
+
+            producer = asyncio.create_task(asyncio.to_thread(parse))
+            try:
+                while True:
+                    batch = await batches.get()
+                    if batch is None:
+                        break
+                    counts["chunks"] += len(batch)
+                    await self._upsert_batch(contract_id, batch, existing, seen, added, batch_key)
+                await producer # Re-raises parsing errors
+            except BaseException:
+                # Stop the parser and drain the queue so its thread is not left blocked
+                stop.set()
+                while not producer.done():
+                    try:
+                        batches.get_nowait()
+                    except asyncio.QueueEmpty:
+                        await asyncio.sleep(0.01)
+                # Nothing was registered, so take back what this ingestion stored
+                await asyncio.shield(asyncio.to_thread(self._discard, batch_key, list(added)))
+                raise
+
+            if added:
+                await asyncio.to_thread(vector_store_manager.commit_batch, batch_key)
+                db.add_all(
+                    ContractChunk(contract_id=contract_id, chunk_hash=chunk_hash, vector_id=vector_id)
+                    for vector_id, chunk_hash in added.items()
+                )
+                await db.commit()
+
+            # Drop chunks that are no longer part of the document
+            stale = [vector_id for h, vector_id in existing.items() if h not in seen]
+            if stale:
+                await asyncio.to_thread(vector_store_manager.delete, stale)
+                await asyncio.to_thread(bm25_index.delete, stale)
+                await db.execute(delete(ContractChunk).where(ContractChunk.vector_id.in_(stale)))
+                await db.commit()
+
+        print(f"Ingested contract {contract_id}: {len(added)} new, {len(stale)} removed, "
+              f"{len(seen) - len(added)} unchanged chunks")
+        return counts["chunks"]
+
+    async def _upsert_batch(self, contract_id: int, batch: List[Document], existing: Dict[str, str],
+                            seen: set, added: Dict[str, str], batch_key: str):
+        """
+        Embeds and stores the chunks of `batch` that are new for the contract, staged under
+        `batch_key`, and records them in `added`.
+        """
+        new_chunks: Dict[str, Document] = {}
+        unchanged: Dict[str, Document] = {}
+        for c in batch:
+            chunk_hash = self.hash_chunk(c.page_content)
+            # Identical chunk text within a document only needs to be stored once
+            if chunk_hash in seen:
+                continue
+            seen.add(chunk_hash)
+            c.metadata["chunk_hash"] = chunk_hash
+            if chunk_hash in existing:
+                unchanged[existing[chunk_hash]] = c
+            else:
+                new_chunks[self._vector_id(contract_id, chunk_hash)] = c
+
+        # Store only new chunks in Vector DB
+        if new_chunks:
+            ids = list(new_chunks)
+            texts = [new_chunks[i].page_content for i in ids]
+            metadatas = [new_chunks[i].metadata for i in ids]
+            await vector_store_manager.aadd_texts(texts, metadatas, ids=ids, batch=batch_key)
+            for vector_id, c in new_chunks.items():
+                added[vector_id] = c.metadata["chunk_hash"]
+            await asyncio.to_thread(bm25_index.add, ids, texts, metadatas)
+
+        # Backfill the keyword index for unchanged chunks ingested before it existed
+        missing = await asyncio.to_thread(bm25_index.missing, list(unchanged))
+        if missing:
+            await asyncio.to_thread(
+                bm25_index.add,
+                missing,
+                [unchanged[i].page_content for i in missing],
+                [unchanged[i].metadata for i in missing]
+            )
+
+    @staticmethod
+    def _discard(batch_key: str, vector_ids: List[str]):
+        vector_store_manager.abort_batch(batch_key)
+        if vector_ids:
+            bm25_index.delete(vector_ids)
+
+    async def remove_contract(self, contract_id: int):
+        """
+        Removes every stored chunk of a contract from the vector store, keyword index and chunk registry.
+        """
+        async with AsyncSessionLocal() as db:
+            vector_ids = list(await db.scalars(
+                select(ContractChunk.vector_id).where(ContractChunk.contract_id == contract_id)
+            ))
+            await asyncio.to_thread(vector_store_manager.delete, vector_ids)
+            await asyncio.to_thread(bm25_index.delete, vector_ids)
+            await asyncio.to_thread(contract_index.delete, contract_id)
+            await db.execute(delete(ContractChunk).where(ContractChunk.contract_id == contract_id))
+            await db.commit()
+
+    # --- Contract-level index ---
+
+    @staticmethod
+    def profile_text(contract: Contract) -> str:
+        """
+        The text a contract is found by in the contract-level index: its summary, lifecycle
+        metadata, extracted clauses (truncated) and risks.
+        """
+        def date(value):
+            return value.date().isoformat() if value else "Not specified"
+
+        lines = [
+            f"Contract: {contract.filename}",
+            f"Summary: {contract.summary or 'Not available'}",
+            f"Start date: {date(contract.start_date)}",
+            f"End date: {date(contract.end_date)}",
+            f"Notice period: {f'{contract.notice_period_days} days' if contract.notice_period_days else 'Not specified'}",
+            f"Renewal terms: {contract.renewal_terms or 'Not specified'}",
+        ]
+        lines += [f"{clause.category}: {(clause.text or '')[:PROFILE_CLAUSE_CHARS]}" for clause in contract.clauses]
+        lines += [f"Risk ({risk.risk_level.value if risk.risk_level else 'low'}): {risk.description or ''}" for risk in contract.risks]
+        return "\n".join(lines)
+
+    async def index_contract_profile(self, db, contract_id: int):
+        """
+        Adds or refreshes a contract's profile in the contract-level index.
+        """
+        contract = await db.scalar(
+            select(Contract).options(selectinload(Contract.clauses), selectinload(Contract.risks))
+            .where(Contract.id == contract_id)
+        )
+        if contract is not None:
+            await asyncio.to_thread(contract_index.upsert, contract_id, self.profile_text(contract))
+
+    def start_profile_backfill(self):
+        self._backfill_task = asyncio.create_task(self._backfill_profiles())
+
+    async def _backfill_profiles(self):
+        """
+        Indexes analyzed contracts that have no profile yet (e.g. analyzed before the index existed).
+        """
+        try:
+            async with AsyncSessionLocal() as db:
+                contract_ids = list(await db.scalars(select(Contract.id).where(Contract.status == ContractStatus.ANALYZED)))
+                missing = await asyncio.to_thread(contract_index.missing, contract_ids)
+                for contract_id in missing:
+                    await self.index_contract_profile(db, contract_id)
+                    db.expunge_all() # Keep the session small over large vaults
+            if missing:
+                print(f"Indexed {len(missing)} contract profiles")
+        except Exception as e:
+            print(f"Contract profile backfill error: {e}")
+
+    @staticmethod
+    def _vector_id(contract_id: int, chunk_hash: str) -> str:
+        return f"{contract_id}-{chunk_hash}"
 
 ingestion_service = IngestionService()
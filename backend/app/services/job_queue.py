@@ -0,0 +1,333 @@
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.models.db import AnalysisJob, JobStatus, Contract, ContractStatus
+from app.services.pipeline import PIPELINE_STEPS, run_analysis_pipeline
+
+ACTIVE_STATUSES = (JobStatus.QUEUED, JobStatus.RUNNING)
+
+class JobCancelled(Exception):
+    pass
+
+class JobLeaseLost(Exception):
+    # Another process reclaimed the job after this one stopped heartbeating
+    pass
+
+class JobQueue:
+    """
+    Durable analysis job queue.
+    Jobs live in the analysis_jobs table, so queued work survives restarts, and are processed
+    by a fixed pool of asyncio workers (highest priority first, then oldest).
+    Failed jobs are retried with exponential backoff until max_attempts is reached.
+    A claimed job is leased to this process (locked_by) and its heartbeat_at is renewed while
+    it runs; only jobs whose heartbeat expired (their process died) are requeued, so several
+    processes can share the queue without re-running each other's jobs.
+    """
+    def __init__(self, workers: int, max_attempts: int, retry_backoff_seconds: int, poll_interval_seconds: float, lease_seconds: int):
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.lease_seconds = max(3, lease_seconds)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._worker_tasks: List[asyncio.Task] = []
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._running: Dict[int, asyncio.Task] = {}
+        self._cancel_requested: Set[int] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+
+    # --- Public API ---
+
+    async def enqueue(self, db: AsyncSession, contract_id: int, file_path: str, priority: int = 0) -> AnalysisJob:
+        """
+        Queues an analysis for a contract. If the contract already has a queued or
+        running job, that job is returned instead of creating a duplicate.
+        """
+        existing = await self.active_job(db, contract_id)
+        if existing:
+            return existing
+
+        job = AnalysisJob(
+            contract_id=contract_id,
+            file_path=file_path,
+            priority=priority,
+            max_attempts=self.max_attempts,
+            progress={"completed": []}
+        )
+        db.add(job)
+        await db.commit()
+        await db.refresh(job)
+
+        if self._wakeup:
+            self._wakeup.set()
+        return job
+
+    async def cancel(self, db: AsyncSession, job: AnalysisJob) -> bool:
+        """
+        Cancels a queued or running job. Returns False if the job had already finished.
+        """
+        if job.status not in ACTIVE_STATUSES:
+            return False
+
+        job.status = JobStatus.CANCELLED
+        job.finished_at = datetime.utcnow()
+        await db.commit()
+
+        task = self._running.get(job.id)
+        if task:
+            # The job's own handler restores the contract status
+            self._cancel_requested.add(job.id)
+            task.cancel()
+        else:
+            # Queued here, or running in another process (which notices on its next step)
+            await self._release_contract(db, job.contract_id)
+        return True
+
+    @staticmethod
+    async def active_job(db: AsyncSession, contract_id: int) -> Optional[AnalysisJob]:
+        return await db.scalar(select(AnalysisJob).where(
+            AnalysisJob.contract_id == contract_id,
+            AnalysisJob.status.in_(ACTIVE_STATUSES)
+        ).limit(1))
+
+    @staticmethod
+    async def pending_count(db: AsyncSession) -> int:
+        """
+        Number of jobs queued or running, across all processes.
+        """
+        return await db.scalar(
+            select(func.count(AnalysisJob.id)).where(AnalysisJob.status.in_(ACTIVE_STATUSES))
+        )
+
+    @staticmethod
+    def to_dict(job: AnalysisJob) -> dict:
+        completed = (job.progress or {}).get("completed", [])
+        steps = {step: ("completed" if step in completed else "pending") for step in PIPELINE_STEPS}
+        return {
+            "id": job.id,
+            "contract_id": job.contract_id,
+            "status": job.status,
+            "priority": job.priority,
+            "attempts": job.attempts,
+            "max_attempts": job.max_attempts,
+            "progress": {
+                "steps": steps,
+                "current_step": (job.progress or {}).get("current"),
+                "percent": round(100 * sum(1 for s in steps.values() if s == "completed") / len(steps)),
+            },
+            "error": job.error,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+            "next_run_at": job.next_run_at if job.status == JobStatus.QUEUED else None,
+        }
+
+    async def start(self):
+        # Jobs left running by a process that died are queued again (live processes keep theirs)
+        await self._reclaim_expired()
+
+        self._wakeup = asyncio.Event()
+        self._worker_tasks = [asyncio.create_task(self._worker_loop()) for _ in range(self.workers)]
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        tasks = self._worker_tasks + ([self._heartbeat_task] if self._heartbeat_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._heartbeat_task = None
+
+        # Hand this process's interrupted jobs back right away instead of waiting for the lease to expire
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(AnalysisJob).where(
+                AnalysisJob.status == JobStatus.RUNNING,
+                AnalysisJob.locked_by == self.worker_id
+            ).values(status=JobStatus.QUEUED, locked_by=None, heartbeat_at=None))
+            await db.commit()
+
+    # --- Leases ---
+
+    async def _reclaim_expired(self) -> int:
+        """
+        Requeues running jobs whose heartbeat is older than the lease. Returns how many.
+        """
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(update(AnalysisJob).where(
+                AnalysisJob.status == JobStatus.RUNNING,
+                or_(
+                    AnalysisJob.heartbeat_at.is_(None),
+                    AnalysisJob.heartbeat_at < datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+                )
+            ).values(status=JobStatus.QUEUED, locked_by=None, heartbeat_at=None))
+            await db.commit()
+            return result.rowcount or 0
+
+    async def _heartbeat_loop(self):
+        """
+        Renews the lease of this process's running jobs and requeues jobs of dead processes.
+        """
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if self._running:
+                    async with AsyncSessionLocal() as db:
+                        await db.execute(update(AnalysisJob).where(
+                            AnalysisJob.id.in_(list(self._running)),
+                            AnalysisJob.status == JobStatus.RUNNING,
+                            AnalysisJob.locked_by == self.worker_id
+                        ).values(heartbeat_at=datetime.utcnow()))
+                        await db.commit()
+                reclaimed = await self._reclaim_expired()
+                if reclaimed:
+                    print(f"Requeued {reclaimed} jobs with an expired lease")
+                    self._wakeup.set()
+            except Exception as e:
+                print(f"Job heartbeat error: {e}")
+
+    # --- Workers ---
+
+    async def _worker_loop(self):
+        while True:
+            job_id = await self._claim_next()
+            if job_id is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._run_job(job_id))
+            self._running[job_id] = task
+            try:
+                await task
+            except Exception as e:
+                print(f"Job {job_id} worker error: {e}")
+            finally:
+                self._running.pop(job_id, None)
+                self._cancel_requested.discard(job_id)
+
+    async def _claim_next(self) -> Optional[int]:
+        """
+        Atomically moves the next due job from QUEUED to RUNNING and returns its id.
+        """
+        async with AsyncSessionLocal() as db:
+            now = datetime.utcnow()
+            job = await db.scalar(select(AnalysisJob).where(
+                AnalysisJob.status == JobStatus.QUEUED,
+                AnalysisJob.next_run_at <= now
+            ).order_by(AnalysisJob.priority.desc(), AnalysisJob.created_at.asc()).limit(1))
+            if not job:
+                return None
+
+            # Conditional update, so only one worker (or process) can claim the job
+            claimed = await db.execute(update(AnalysisJob).where(
+                AnalysisJob.id == job.id,
+                AnalysisJob.status == JobStatus.QUEUED
+            ).values(
+                status=JobStatus.RUNNING,
+                attempts=(job.attempts or 0) + 1,
+                started_at=now,
+                locked_by=self.worker_id,
+                heartbeat_at=now,
+                error=None,
+                progress={"completed": []}
+            ))
+            await db.commit()
+            return job.id if claimed.rowcount else None
+
+    async def _run_job(self, job_id: int):
+        # Job bookkeeping and the pipeline each get their own session for this run
+        async with AsyncSessionLocal() as job_db, AsyncSessionLocal() as db:
+            job = await job_db.get(AnalysisJob, job_id)
+            contract = await job_db.get(Contract, job.contract_id)
+            if contract is None:
+                await self._finish(job_db, job, JobStatus.FAILED, "Contract not found")
+                return
+            contract.status = ContractStatus.PROCESSING
+            await job_db.commit()
+
+            async def on_progress(step: str):
+                await job_db.refresh(job)
+                if job.status == JobStatus.CANCELLED:
+                    raise JobCancelled()
+                if job.locked_by != self.worker_id:
+                    raise JobLeaseLost()
+                completed = list((job.progress or {}).get("completed", []))
+                completed.append(step)
+                job.progress = {"completed": completed, "current": step}
+                await job_db.commit()
+
+            try:
+                await run_analysis_pipeline(
+                    job.contract_id, job.file_path, db, filename=contract.filename, on_progress=on_progress
+                )
+                await self._finish(job_db, job, JobStatus.SUCCEEDED)
+            except asyncio.CancelledError:
+                if job_id not in self._cancel_requested:
+                    raise # Worker shutdown: leave the job RUNNING so it is requeued
+                await db.rollback()
+                await self._release_contract(job_db, job.contract_id)
+            except JobCancelled:
+                await db.rollback()
+                await self._release_contract(job_db, job.contract_id)
+            except JobLeaseLost:
+                # The job now belongs to another process; leave it and the contract alone
+                await db.rollback()
+                print(f"Job {job_id} lease lost, abandoning this run")
+            except Exception as e:
+                print(f"Job {job_id} failed (attempt {job.attempts}/{job.max_attempts}): {e}")
+                await db.rollback()
+                await job_db.refresh(job)
+                if job.status == JobStatus.CANCELLED:
+                    await self._release_contract(job_db, job.contract_id)
+                elif job.locked_by != self.worker_id:
+                    pass # Reclaimed by another process, which owns the retry now
+                elif job.attempts < job.max_attempts:
+                    # Retry with exponential backoff
+                    delay = self.retry_backoff_seconds * (2 ** (job.attempts - 1))
+                    job.status = JobStatus.QUEUED
+                    job.locked_by = None
+                    job.heartbeat_at = None
+                    job.error = str(e)
+                    job.next_run_at = datetime.utcnow() + timedelta(seconds=delay)
+                    await job_db.commit()
+                else:
+                    await self._finish(job_db, job, JobStatus.FAILED, str(e))
+                    contract = await job_db.get(Contract, job.contract_id)
+                    if contract:
+                        contract.status = ContractStatus.FAILED
+                        await job_db.commit()
+
+    @staticmethod
+    async def _finish(db: AsyncSession, job: AnalysisJob, status: JobStatus, error: str = None):
+        job.status = status
+        job.error = error
+        job.finished_at = datetime.utcnow()
+        await db.commit()
+
+    @staticmethod
+    async def _release_contract(db: AsyncSession, contract_id: int):
+        """
+        Restores a contract's status after its job was cancelled.
+        """
+        contract = await db.get(Contract, contract_id)
+        if contract and contract.status == ContractStatus.PROCESSING:
+            contract.status = ContractStatus.ANALYZED if contract.summary else ContractStatus.UPLOADED
+            await db.commit()
+
+job_queue = JobQueue(
+    workers=settings.JOB_WORKERS,
+    max_attempts=settings.JOB_MAX_ATTEMPTS,
+    retry_backoff_seconds=settings.JOB_RETRY_BACKOFF_SECONDS,
+    poll_interval_seconds=settings.JOB_POLL_INTERVAL_SECONDS,
+    lease_seconds=settings.JOB_LEASE_SECONDS
+)
@@ -0,0 +1,129 @@
+import re
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.agents.graph import NODES, app_graph
+from app.models.db import Contract, ContractStatus, Clause, Risk, RiskLevel
+from app.services.ingestion import ingestion_service
+from app.services.portfolio_stats import portfolio_stats_service
+from app.services.alert_service import alert_service
+from app.services.compare_service import compare_service
+
+# Steps reported through on_progress, in execution order (graph nodes may finish in any order)
+PIPELINE_STEPS = ["ingest"] + list(NODES) + ["save"]
+
+ProgressCallback = Callable[[str], Awaitable[None]]
+
+async def _report(on_progress: Optional[ProgressCallback], step: str):
+    if on_progress:
+        await on_progress(step)
+
+async def run_analysis_pipeline(contract_id: int, file_path: str, db: AsyncSession, filename: Optional[str] = None,
+                                on_progress: Optional[ProgressCallback] = None):
+    """
+    Ingests a contract file, runs the agent graph and stores the results.
+    `filename` is the contract's display name, used as the source of its chunks.
+    `db` must be an async session owned by the caller's task (not a request-scoped session).
+    Raises on failure; the caller decides whether to retry or mark the contract as failed.
+    """
+    # 1. Ingest
+    await ingestion_service.ingest_file(file_path, contract_id, filename)
+    await _report(on_progress, "ingest")
+    
+    # 2. Run Agents (streamed per node so progress can be reported)
+    initial_state = {"contract_id": contract_id, "extracted_clauses": [], "risks": []}
+    result = dict(initial_state)
+    async for update in app_graph.astream(initial_state, stream_mode="updates"):
+        for node_name, node_output in update.items():
+            result.update(node_output or {})
+            await _report(on_progress, node_name)
+    
+    # 3. Update DB
+    contract = await db.get(Contract, contract_id)
+    # What the previous analysis contributed to the portfolio stats
+    old_stats = await portfolio_stats_service.contribution(db, contract_id)
+    contract.summary = result.get("summary")
+    contract.status = ContractStatus.ANALYZED
+    # Store full result json (minus the raw retrieval contexts)
+    contract.metadata_json = {k: v for k, v in result.items() if k != "contexts"}
+    
+    # CLEAR OLD DATA (for re-runs)
+    await db.execute(delete(Clause).where(Clause.contract_id == contract_id))
+    await db.execute(delete(Risk).where(Risk.contract_id == contract_id))
+    await db.flush() # Saved in one transaction with the new results below
+    
+    # POPULATE CLAUSES
+    extracted_clauses = result.get("extracted_clauses", [])
+    for c_data in extracted_clauses:
+        clause = Clause(
+            contract_id=contract_id,
+            category=c_data.get("category"),
+            text=c_data.get("text", "")
+        )
+        db.add(clause)
+        
+    # POPULATE RISKS
+    risks_data = result.get("risks", [])
+    for r_data in risks_data:
+        # Map risk level string to Enum if needed, or rely on string compatibility
+        level_str = r_data.get("risk_level", "low").lower()
+        if level_str == "high": level = RiskLevel.HIGH
+        elif level_str == "medium": level = RiskLevel.MEDIUM
+        elif level_str == "critical": level = RiskLevel.CRITICAL
+        else: level = RiskLevel.LOW
+        
+        risk = Risk(
+            contract_id=contract_id,
+            clause_id=None, # We'd need complex mapping to link exact clause ID here
+            description=r_data.get("reasoning", ""), # Using reasoning as description
+            risk_level=level,
+            recommendation=r_data.get("recommendation", "")
+        )
+        db.add(risk)
+    
+    # Save lifecycle info
+    lifecycle = result.get("lifecycle", {})
+    if lifecycle:
+        # Parse dates safely
+        def parse_date(date_str):
+            if not date_str: return None
+            try:
+                return datetime.strptime(date_str, "%Y-%m-%d")
+            except:
+                return None
+
+        contract.start_date = parse_date(lifecycle.get("start_date"))
+        contract.end_date = parse_date(lifecycle.get("end_date"))
+        contract.renewal_terms = lifecycle.get("renewal_terms")
+        
+        # Safe int casting
+        npCallback = lifecycle.get("notice_period_days")
+        if npCallback:
+            if isinstance(npCallback, int):
+                contract.notice_period_days = npCallback
+            elif isinstance(npCallback, str):
+                # Try to find digits
+                ints = re.findall(r'\d+', npCallback)
+                if ints:
+                    contract.notice_period_days = int(ints[0])
+
+        # Generate Alerts (upserted, so re-analysis does not duplicate them)
+        await alert_service.sync_contract_alerts(db, contract)
+
+    # Update the portfolio stats by the difference with the previous analysis
+    await db.flush()
+    new_stats = await portfolio_stats_service.contribution(db, contract_id)
+    await portfolio_stats_service.apply(db, portfolio_stats_service.diff(new_stats, old_stats))
+    # Cached comparisons were made against the previous clauses
+    await compare_service.invalidate(db, contract_id)
+
+    await db.commit()
+
+    # Make the contract findable by global questions through its new summary and metadata.
+    # The analysis is already saved, so a failure here must not fail the job (backfilled on restart).
+    try:
+        await ingestion_service.index_contract_profile(db, contract_id)
+    except Exception as e:
+        print(f"Error indexing contract profile: {e}")
+    await _report(on_progress, "save")
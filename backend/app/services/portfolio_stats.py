@@ -0,0 +1,119 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Tuple
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.db import Clause, Contract, ContractStatus, PortfolioStat, Risk, RiskLevel
+
+EXPIRY_WINDOWS_DAYS = (30, 60, 90)
+UNCATEGORIZED = "Uncategorized"
+
+StatKey = Tuple[str, str] # (dimension, bucket)
+TOTAL: StatKey = ("contracts", "total")
+
+class PortfolioStatsService:
+    """
+    Portfolio analytics backed by the portfolio_stats table.
+    Each contract contributes counters (itself to the total, risks per level, clauses per category
+    and its end date); uploads, the pipeline and contract deletion apply the difference in the same
+    transaction as their own writes, so reading the dashboard costs the same however many contracts exist.
+    Counters are updated with atomic upserts, so concurrent job workers never lose an update.
+    Expiry windows are summed from per-day buckets, so they stay correct as time passes.
+    The analyzed count follows contract status, which changes outside the pipeline, so it is
+    counted through the contracts.status index instead.
+    """
+
+    @staticmethod
+    async def contribution(db: AsyncSession, contract_id: int) -> Counter:
+        """
+        Counters a contract currently contributes, computed from its stored rows.
+        """
+        counts: Counter = Counter()
+        contract = (await db.execute(select(Contract.end_date).where(Contract.id == contract_id))).first()
+        if contract is None:
+            return counts
+        counts[TOTAL] = 1
+        end_date = contract.end_date
+        if end_date:
+            counts[("expiry", end_date.date().isoformat())] = 1
+
+        for level, n in await db.execute(
+            select(Risk.risk_level, func.count(Risk.id)).where(Risk.contract_id == contract_id).group_by(Risk.risk_level)
+        ):
+            counts[("risk_level", RiskLevel(level).value if level else RiskLevel.LOW.value)] += n
+        for category, n in await db.execute(
+            select(Clause.category, func.count(Clause.id)).where(Clause.contract_id == contract_id).group_by(Clause.category)
+        ):
+            counts[("clause_category", category or UNCATEGORIZED)] += n
+        return counts
+
+    @staticmethod
+    def diff(new: Counter, old: Counter) -> Dict[StatKey, int]:
+        return {key: new.get(key, 0) - old.get(key, 0) for key in set(new) | set(old) if new.get(key, 0) != old.get(key, 0)}
+
+    @staticmethod
+    async def apply(db: AsyncSession, delta: Dict[StatKey, int]):
+        """
+        Adds `delta` to the counters in one INSERT ... ON CONFLICT DO UPDATE SET value = value + change.
+        Does not commit; the caller commits with its own changes.
+        """
+        rows = [
+            {"dimension": dimension, "bucket": bucket, "value": change}
+            for (dimension, bucket), change in sorted(delta.items()) if change # Sorted: a stable lock order
+        ]
+        if not rows:
+            return
+        dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+        stmt = dialect.insert(PortfolioStat).values(rows)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[PortfolioStat.dimension, PortfolioStat.bucket],
+            set_={"value": func.coalesce(PortfolioStat.value, 0) + stmt.excluded.value}
+        ))
+        # Drop empty buckets so the table stays as small as the set of distinct values
+        await db.execute(delete(PortfolioStat).where(
+            tuple_(PortfolioStat.dimension, PortfolioStat.bucket).in_([(r["dimension"], r["bucket"]) for r in rows]),
+            PortfolioStat.value <= 0
+        ))
+
+    async def get_stats(self, db: AsyncSession) -> dict:
+        now = datetime.utcnow()
+        today = now.date().isoformat()
+        horizon = (now + timedelta(days=max(EXPIRY_WINDOWS_DAYS))).date().isoformat()
+
+        analyzed = await db.scalar(
+            select(func.count()).select_from(Contract).where(Contract.status == ContractStatus.ANALYZED)
+        )
+        rows = await db.execute(
+            select(PortfolioStat.dimension, PortfolioStat.bucket, PortfolioStat.value)
+            .where(PortfolioStat.dimension != "expiry")
+        )
+        breakdowns: Dict[str, Dict[str, int]] = {}
+        for dimension, bucket, value in rows:
+            breakdowns.setdefault(dimension, {})[bucket] = value
+
+        # Only the day buckets inside the largest window are read
+        expiring = {str(days): 0 for days in EXPIRY_WINDOWS_DAYS}
+        for bucket, value in await db.execute(
+            select(PortfolioStat.bucket, PortfolioStat.value).where(
+                PortfolioStat.dimension == "expiry",
+                PortfolioStat.bucket > today,
+                PortfolioStat.bucket <= horizon
+            )
+        ):
+            for days in EXPIRY_WINDOWS_DAYS:
+                if bucket <= (now + timedelta(days=days)).date().isoformat():
+                    expiring[str(days)] += value
+
+        risk_levels = {level.value: breakdowns.get("risk_level", {}).get(level.value, 0) for level in RiskLevel}
+        return {
+            "total_contracts": breakdowns.get(TOTAL[0], {}).get(TOTAL[1], 0),
+            "analyzed_contracts": analyzed,
+            "high_risks": risk_levels[RiskLevel.HIGH.value] + risk_levels[RiskLevel.CRITICAL.value],
+            "expiring_soon": expiring[str(EXPIRY_WINDOWS_DAYS[0])],
+            "risk_levels": risk_levels,
+            "clause_categories": breakdowns.get("clause_category", {}),
+            "expiring": expiring,
+        }
+
+portfolio_stats_service = PortfolioStatsService()
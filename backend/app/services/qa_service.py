@@ -1,28 +1,240 @@
+import asyncio
 import json
+import re
+from typing import AsyncIterator, List, Optional, Tuple
 from langchain_core.messages import SystemMessage, HumanMessage
-from app.core.llm import get_llm
+from app.core.config import settings
+from app.core.llm import get_llm, parse_json_response
+from app.db.contract_index import contract_index
 from app.services.rag import rag_service
 
+# Separates the streamed free-text part of a response from its trailing JSON
+STREAM_DELIMITER = "###END_OF_TEXT###"
+
+NO_CONTEXT_ANSWER = "I could not find any relevant information in your contracts to answer your question."
+
 class QAService:
     def __init__(self):
         self.llm = get_llm(temperature=0.0) # Low temp for factual answers
 
-    async def ask_question(self, question: str, contract_id: int = None):
-        # 1. Retrieve relevant chunks (Global or Specific)
+    def _retrieve_context(self, question: str, contract_id: int = None) -> str:
+        """
+        Retrieves relevant chunks (Global or Specific) and formats them as LLM context.
+        Returns an empty string if nothing relevant was found.
+        """
         filter_dict = {"contract_id": contract_id} if contract_id else None
         
         # Increase k for global search to capture more context
         k = 5 if contract_id else 10
         docs = rag_service.retrieve(question, k=k, filter=filter_dict)
-        
+        return rag_service.format_docs(docs) if docs else ""
+
+    async def _stream_sections(self, prompt: str) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Streams an LLM response laid out as free text, STREAM_DELIMITER, then JSON.
+        Yields ("token", text) while the free text is generated, then ("tail", json_text) once.
+        """
+        buffer = ""
+        tail = None
+        async for chunk in self.llm.astream([HumanMessage(content=prompt)], validate=self._validate_sections):
+            if tail is not None:
+                tail += chunk.content
+                continue
+
+            buffer += chunk.content
+            idx = buffer.find(STREAM_DELIMITER)
+            if idx != -1:
+                if idx:
+                    yield "token", buffer[:idx]
+                tail = buffer[idx + len(STREAM_DELIMITER):]
+                buffer = ""
+                continue
+
+            # Hold back anything that could be the start of the delimiter
+            safe = len(buffer) - (len(STREAM_DELIMITER) - 1)
+            if safe > 0:
+                yield "token", buffer[:safe]
+                buffer = buffer[safe:]
+
+        if buffer:
+            yield "token", buffer
+        yield "tail", tail or ""
+
+    @staticmethod
+    def _parse_json(content: str) -> dict:
+        """
+        Extracts the JSON object from a response; raises if there is none.
+        Also used as the cache validator, so malformed responses are not cached.
+        """
+        json_match = re.search(r"\{.*\}", content, re.DOTALL)
+        data = json.loads(json_match.group(0) if json_match else content)
+        if not isinstance(data, dict):
+            raise ValueError("Response is not a JSON object")
+        return data
+
+    @classmethod
+    def _validate_sections(cls, content: str):
+        if STREAM_DELIMITER not in content:
+            raise ValueError("Streamed response has no JSON section")
+        cls._parse_json(content.split(STREAM_DELIMITER, 1)[1])
+
+    @staticmethod
+    def _parse_tail(tail: str) -> dict:
+        json_match = re.search(r"\{.*\}", tail, re.DOTALL)
+        try:
+            data = json.loads(json_match.group(0) if json_match else tail)
+            return data if isinstance(data, dict) else {}
+        except json.JSONDecodeError:
+            print(f"Failed to parse streamed JSON. Content: {tail}")
+            return {}
+
+    # --- Global questions: contract-level index, then map-reduce over the selected contracts ---
+
+    async def _global_partials(self, question: str) -> Optional[List[dict]]:
+        """
+        Stage 1 selects candidate contracts from the contract-level index; stage 2 searches chunks
+        only within each candidate and answers per contract (map), concurrently.
+        Returns the relevant per-contract answers, or None if the contract index is still empty.
+        """
+        candidates = await asyncio.to_thread(contract_index.search, question, settings.GLOBAL_QA_CANDIDATE_CONTRACTS)
+        if not candidates:
+            return None
+
+        semaphore = asyncio.Semaphore(max(1, settings.GLOBAL_QA_MAX_CONCURRENCY))
+        results = await asyncio.gather(
+            *(self._answer_for_contract(question, contract_id, semaphore) for contract_id in candidates),
+            return_exceptions=True
+        )
+        partials = []
+        for contract_id, result in zip(candidates, results):
+            if isinstance(result, Exception):
+                print(f"Global Q&A error (contract {contract_id}): {result}")
+            elif result:
+                partials.append(result)
+        return partials
+
+    async def _answer_for_contract(self, question: str, contract_id: int, semaphore: asyncio.Semaphore) -> Optional[dict]:
+        """
+        Map step: answers the question from one contract's chunks. Returns None if they are not relevant.
+        """
+        docs = await asyncio.to_thread(
+            rag_service.retrieve, question, settings.GLOBAL_QA_CHUNKS_PER_CONTRACT, {"contract_id": contract_id}
+        )
         if not docs:
+            return None
+        source = docs[0].metadata.get("source", f"Contract {contract_id}")
+
+        prompt = f"""
+        You are a strict legal analyst. Using ONLY the context below from the contract "{source}",
+        answer the part of the user's question that this contract can answer.
+
+        Context:
+        {rag_service.format_docs(docs)}
+
+        Question:
+        {question}
+
+        Requirements:
+        1. If the context does not help answer the question, set "relevant" to false and leave the rest empty.
+        2. Provide CITATIONS: exact clause text from the context that supports your answer.
+        3. DO NOT hallucinate or use outside knowledge.
+
+        Return JSON:
+        {{
+            "relevant": true,
+            "answer": "What this contract says about the question...",
+            "citations": [
+                {{
+                    "clause_text": "Exact text from contract...",
+                    "clause_type": "Type...",
+                    "explanation": "Why this supports the answer..."
+                }}
+            ],
+            "confidence": "High|Medium|Low"
+        }}
+        """
+
+        async with semaphore:
+            response = await self.llm.ainvoke([HumanMessage(content=prompt)], validate=self._parse_json)
+        data = self._parse_tail(response.content.strip())
+        if not data.get("relevant") or not data.get("answer"):
+            return None
+        return {
+            "contract_id": contract_id,
+            "source": source,
+            "answer": data["answer"],
+            "citations": [dict(c, source=source, contract_id=contract_id) for c in data.get("citations", []) if isinstance(c, dict)],
+            "confidence": data.get("confidence", "low"),
+        }
+
+    @staticmethod
+    def _reduce_prompt(question: str, partials: List[dict], output_format: str) -> str:
+        findings = "\n\n".join(f"Contract: {p['source']}\nFinding: {p['answer']}" for p in partials)
+        return f"""
+        You are a strict legal analyst. Answer the user's question across the contract portfolio,
+        using ONLY the per-contract findings below. Name the contract each statement comes from.
+
+        Findings:
+        {findings}
+
+        Question:
+        {question}
+
+        Requirements:
+        1. Answer directly and concisely, combining and contrasting the findings.
+        2. DO NOT add facts that are not in the findings.
+
+        {output_format}
+        """
+
+    async def _reduce(self, question: str, partials: List[dict]) -> dict:
+        """
+        Reduce step: combines the per-contract answers into one.
+        """
+        if not partials:
+            return {"answer": NO_CONTEXT_ANSWER, "citations": [], "confidence": "low"}
+        citations = [c for p in partials for c in p["citations"]]
+        if len(partials) == 1:
+            return {"answer": partials[0]["answer"], "citations": citations, "confidence": partials[0]["confidence"]}
+
+        prompt = self._reduce_prompt(question, partials, """Return JSON:
+        {
+            "answer": "Combined answer here...",
+            "confidence": "High|Medium|Low"
+        }""")
+        response = await self.llm.ainvoke([HumanMessage(content=prompt)], validate=self._parse_json)
+        data = self._parse_tail(response.content.strip())
+        return {
+            "answer": data.get("answer") or "\n\n".join(f"{p['source']}: {p['answer']}" for p in partials),
+            "citations": citations,
+            "confidence": data.get("confidence", "low")
+        }
+
+    async def ask_question(self, question: str, contract_id: int = None):
+        if contract_id is None:
+            try:
+                partials = await self._global_partials(question)
+                if partials is not None:
+                    return await self._reduce(question, partials)
+            except Exception as e:
+                print(f"Error in QAService: {e}")
+                return {
+                    "answer": f"I encountered an error analyzing the contracts. ({str(e)})",
+                    "citations": [],
+                    "confidence": "zero"
+                }
+            # Contract index not built yet: fall back to one search across all chunks
+
+        # 1. Retrieve relevant chunks (Global or Specific)
+        # Embedding and the keyword index are blocking, keep them off the event loop
+        context = await asyncio.to_thread(self._retrieve_context, question, contract_id)
+        
+        if not context:
              return {
-                "answer": "I could not find any relevant information in your contracts to answer your question.",
+                "answer": NO_CONTEXT_ANSWER,
                 "citations": [],
                 "confidence": "low"
             }
-
-        context = rag_service.format_docs(docs)
         
         # 2. Construct Prompt
         # Rigid prompt for structured output and strict grounding
@@ -58,22 +270,13 @@ class QAService:
 
         # 3. Call LLM
         try:
-            response = await self.llm.ainvoke([HumanMessage(content=prompt_text)])
+            response = await self.llm.ainvoke([HumanMessage(content=prompt_text)], validate=self._parse_json)
             content = response.content.strip()
             
             # Robust JSON extraction
-            import re
-            
-            # Try to find JSON block
-            json_match = re.search(r"\{.*\}", content, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-            else:
-                json_str = content
-            
             try:
-                return json.loads(json_str)
-            except json.JSONDecodeError:
+                return self._parse_json(content)
+            except (json.JSONDecodeError, ValueError):
                 # Fallback if invalid JSON
                 print(f"Failed to parse JSON. Content: {content}")
                 return {
@@ -90,6 +293,90 @@ class QAService:
                 "confidence": "zero"
             }
 
+    async def stream_question(self, question: str, contract_id: int = None) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        Streaming variant of ask_question.
+        Yields ("token", {"text"}) events for the answer as it is generated,
+        then a final ("citations", {"citations", "confidence"}) event.
+        Global questions stream the reduce step, once the per-contract answers are in.
+        """
+        if contract_id is None:
+            partials = await self._global_partials(question)
+            if partials is not None:
+                async for event in self._stream_reduce(question, partials):
+                    yield event
+                return
+
+        # Embedding and the keyword index are blocking, keep them off the event loop
+        context = await asyncio.to_thread(self._retrieve_context, question, contract_id)
+        if not context:
+            yield "token", {"text": NO_CONTEXT_ANSWER}
+            yield "citations", {"citations": [], "confidence": "low"}
+            return
+
+        prompt_text = f"""
+        You are a strict legal analyst. Answer the user's question based ONLY on the provided contract context.
+        
+        Context:
+        {context}
+        
+        Question: 
+        {question}
+        
+        Requirements:
+        1. Answer directly and concisely.
+        2. Provide CITATIONS: exact clause text from the context that supports your answer.
+        3. Identify the Clause Type (e.g., "Termination", "Confidentiality").
+        4. If the answer is NOT in the context, explicitly state: "The contract does not contain information regarding [topic]."
+        5. DO NOT hallucinate or use outside knowledge.
+        
+        Output format:
+        First write the answer as plain text. Then, on its own line, write {STREAM_DELIMITER}
+        followed by JSON in the following format:
+        {{
+            "citations": [
+                {{
+                    "clause_text": "Exact text from contract...",
+                    "clause_type": "Type...",
+                    "explanation": "Why this supports the answer..."
+                }}
+            ],
+            "confidence": "High|Medium|Low"
+        }}
+        """
+
+        async for kind, text in self._stream_sections(prompt_text):
+            if kind == "token":
+                yield "token", {"text": text}
+            else:
+                data = self._parse_tail(text)
+                yield "citations", {
+                    "citations": data.get("citations", []),
+                    "confidence": data.get("confidence", "low")
+                }
+
+    async def _stream_reduce(self, question: str, partials: List[dict]) -> AsyncIterator[Tuple[str, dict]]:
+        if len(partials) < 2:
+            result = await self._reduce(question, partials)
+            yield "token", {"text": result["answer"]}
+            yield "citations", {"citations": result["citations"], "confidence": result["confidence"]}
+            return
+
+        prompt = self._reduce_prompt(question, partials, f"""Output format:
+        First write the answer as plain text. Then, on its own line, write {STREAM_DELIMITER}
+        followed by JSON:
+        {{
+            "confidence": "High|Medium|Low"
+        }}""")
+        async for kind, text in self._stream_sections(prompt):
+            if kind == "token":
+                yield "token", {"text": text}
+            else:
+                yield "citations", {
+                    "citations": [c for p in partials for c in p["citations"]],
+                    "confidence": self._parse_tail(text).get("confidence", "low")
+                }
+
     async def rewrite_clause(self, clause_text: str, instruction: str) -> dict:
         """
         Rewrites a legal clause based on instructions.
@@ -116,19 +403,45 @@ class QAService:
         """
         
         try:
-            response = await self.llm.ainvoke([HumanMessage(content=prompt)])
-            content = response.content.strip()
-            
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0]
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0]
-                
-            return json.loads(content)
+            response = await self.llm.ainvoke([HumanMessage(content=prompt)], validate=parse_json_response)
+            return parse_json_response(response.content)
         except Exception as e:
             return {
                 "rewritten_text": "Error generating rewrite.",
                 "explanation": str(e)
             }
 
+    async def stream_rewrite(self, clause_text: str, instruction: str) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        Streaming variant of rewrite_clause.
+        Yields ("token", {"text"}) events for the rewritten clause, then a final ("explanation", {"explanation"}) event.
+        """
+        prompt = f"""
+        You are an expert contract literacy lawyer. Your task is to rewrite the following contract clause.
+        
+        Original Clause:
+        "{clause_text}"
+        
+        Instruction:
+        {instruction}
+        
+        Requirements:
+        1. Maintain professional legal tone.
+        2. Be precise and concise.
+        3. Explain the change briefly.
+        
+        Output format:
+        First write only the rewritten clause text. Then, on its own line, write {STREAM_DELIMITER}
+        followed by JSON:
+        {{
+            "explanation": "..."
+        }}
+        """
+
+        async for kind, text in self._stream_sections(prompt):
+            if kind == "token":
+                yield "token", {"text": text}
+            else:
+                yield "explanation", {"explanation": self._parse_tail(text).get("explanation", "")}
+
 qa_service = QAService()
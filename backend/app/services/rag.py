@@ -1,18 +1,179 @@
-from typing import List, Tuple
+import re
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.db.bm25_index import bm25_index
 from app.db.vector_store import vector_store_manager
 from langchain_core.documents import Document
 
+def _doc_key(doc: Document) -> str:
+    # Same id the chunk has in the vector store and the keyword index
+    chunk_hash = doc.metadata.get("chunk_hash")
+    if chunk_hash:
+        return f"{doc.metadata.get('contract_id')}-{chunk_hash}"
+    return doc.page_content
+
+MIN_TEXT_OVERLAP = 20 # Shortest suffix/prefix match treated as a chunk overlap
+MAX_TEXT_OVERLAP = 400 # Splitter overlap is 200 characters, leave some slack
+NEAR_DUPLICATE_SIMILARITY = 0.85
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English legal text, close enough for budgeting
+    return max(1, len(text) // 4)
+
+def _text_overlap(a: str, b: str) -> int:
+    """
+    Length of the longest suffix of `a` that is also a prefix of `b`.
+    """
+    for size in range(min(len(a), len(b), MAX_TEXT_OVERLAP), MIN_TEXT_OVERLAP - 1, -1):
+        if a.endswith(b[:size]):
+            return size
+    return 0
+
+def _word_set(text: str) -> set:
+    return set(re.findall(r"\w+", text.lower()))
+
+class _Block:
+    """
+    A span of contiguous text from one page of one source, built from one or more chunks.
+    """
+    def __init__(self, doc: Document):
+        self.metadata = dict(doc.metadata)
+        self.text = doc.page_content
+        self.start: Optional[int] = doc.metadata.get("start_index")
+        self.words = _word_set(self.text)
+
+    def origin(self) -> tuple:
+        return (self.metadata.get("contract_id"), self.metadata.get("source"), self.metadata.get("page"))
+
+    def merge(self, doc: Document) -> bool:
+        """
+        Absorbs `doc` if it overlaps or directly follows/precedes this block. Returns True if merged.
+        """
+        text = doc.page_content
+        start = doc.metadata.get("start_index")
+        if self.start is not None and start is not None:
+            end, self_end = start + len(text), self.start + len(self.text)
+            if start > self_end or end < self.start:
+                return False
+            if start >= self.start:
+                self.text += text[self_end - start:] if end > self_end else ""
+            else:
+                self.text = text + (self.text[end - self.start:] if self_end > end else "")
+                self.start = start
+        elif text in self.text:
+            pass
+        elif self.text in text:
+            self.text = text
+        elif _text_overlap(self.text, text):
+            self.text += text[_text_overlap(self.text, text):]
+        elif _text_overlap(text, self.text):
+            self.text = text + self.text[_text_overlap(text, self.text):]
+        else:
+            return False
+        self.words = _word_set(self.text)
+        return True
+
+    def is_near_duplicate(self, doc: Document) -> bool:
+        # Share of the candidate's words already covered by this block
+        words = _word_set(doc.page_content)
+        if not words or not self.words:
+            return False
+        return len(words & self.words) / len(words) >= NEAR_DUPLICATE_SIMILARITY
+
 class RAGService:
     def retrieve(self, query: str, k: int = 4, filter: dict = None) -> List[Document]:
         """
         Retrieves relevant documents for a given query.
         """
-        return vector_store_manager.similarity_search(query, k=k, filter=filter)
+        return self.retrieve_many([query], k=k, filter=filter)[0]
+
+    def retrieve_many(self, queries: List[str], k: int = 4, filter: dict = None) -> List[List[Document]]:
+        """
+        Retrieves relevant documents for several queries in one batched call.
+        Returns one list of documents per query.
+        In hybrid mode, vector and BM25 results are fused with reciprocal-rank fusion.
+        """
+        if settings.RETRIEVAL_MODE.lower() != "hybrid":
+            return vector_store_manager.similarity_search_batch(queries, k=k, filter=filter)
+
+        fetch_k = k * settings.HYBRID_FETCH_FACTOR
+        vector_results = vector_store_manager.similarity_search_batch(queries, k=fetch_k, filter=filter)
+        return [
+            self._fuse([vector_docs, self._keyword_search(query, fetch_k, filter)], k)
+            for query, vector_docs in zip(queries, vector_results)
+        ]
+
+    def _keyword_search(self, query: str, k: int, filter: dict = None) -> List[Document]:
+        filter = filter or {}
+        docs = [doc for doc, _ in bm25_index.search(query, k=k, contract_id=filter.get("contract_id"))]
+        # Any other filter keys are plain metadata equality checks
+        conditions = {key: value for key, value in filter.items() if key != "contract_id"}
+        if conditions:
+            docs = [d for d in docs if all(d.metadata.get(key) == value for key, value in conditions.items())]
+        return docs
+
+    @staticmethod
+    def _fuse(rankings: List[List[Document]], k: int) -> List[Document]:
+        """
+        Reciprocal-rank fusion: score(d) = sum over rankings of 1 / (RRF_K + rank).
+        """
+        scores: Dict[str, float] = {}
+        docs: Dict[str, Document] = {}
+        for ranking in rankings:
+            for rank, doc in enumerate(ranking, start=1):
+                key = _doc_key(doc)
+                scores[key] = scores.get(key, 0.0) + 1.0 / (settings.RRF_K + rank)
+                docs.setdefault(key, doc)
+        best = sorted(scores, key=scores.get, reverse=True)[:k]
+        return [docs[key] for key in best]
+
+    def pack_docs(self, docs: List[Document], max_tokens: int = None) -> List[Document]:
+        """
+        Assembles retrieved documents (best first) into a deduplicated context:
+        overlapping or adjacent chunks from the same page are merged, near-duplicates are dropped,
+        and blocks are packed in relevance order until the token budget is used up.
+        """
+        max_tokens = max_tokens or settings.CONTEXT_TOKEN_BUDGET
+
+        blocks: List[_Block] = []
+        for doc in docs:
+            same_origin = [b for b in blocks if b.origin() == (
+                doc.metadata.get("contract_id"), doc.metadata.get("source"), doc.metadata.get("page")
+            )]
+            if any(b.merge(doc) for b in same_origin):
+                continue
+            if any(b.is_near_duplicate(doc) for b in blocks):
+                continue
+            blocks.append(_Block(doc))
+
+        packed = []
+        used = 0
+        for block in blocks:
+            tokens = estimate_tokens(block.text)
+            if used + tokens > max_tokens:
+                if packed:
+                    continue # A smaller, less relevant block may still fit
+                # Always keep (part of) the most relevant block
+                block.text = block.text[:max_tokens * 4]
+                tokens = estimate_tokens(block.text)
+            packed.append(Document(page_content=block.text, metadata=block.metadata))
+            used += tokens
+        return packed
+
+    @staticmethod
+    def source_label(doc: Document) -> str:
+        source = doc.metadata.get("source", "Unknown")
+        page = doc.metadata.get("page")
+        # Loader pages are 0-based
+        return f"{source} (page {page + 1})" if isinstance(page, int) else source
 
-    def format_docs(self, docs: List[Document]) -> str:
+    def format_docs(self, docs: List[Document], max_tokens: int = None) -> str:
         """
-        Formats retrieved documents into a string for the LLM context.
+        Formats retrieved documents into a string for the LLM context,
+        packed to the token budget with source/page attribution.
         """
-        return "\n\n".join(f"Source: {d.metadata.get('source', 'Unknown')}\nContent: {d.page_content}" for d in docs)
+        return "\n\n".join(
+            f"Source: {self.source_label(d)}\nContent: {d.page_content}" for d in self.pack_docs(docs, max_tokens)
+        )
 
 rag_service = RAGService()
@@ -0,0 +1,51 @@
+import asyncio
+import os
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.upload_store import upload_store
+from app.models.db import AnalysisJob, Contract, ContractStatus
+from app.services.job_queue import job_queue
+
+class UploadService:
+    """
+    Links uploaded blobs to contracts. An upload whose content was already uploaded
+    reuses the existing contract and its analysis instead of being ingested and analyzed again.
+    """
+
+    @staticmethod
+    async def find_existing(db: AsyncSession, file_hash: str) -> Optional[Contract]:
+        return await db.scalar(
+            select(Contract).where(Contract.file_hash == file_hash).order_by(Contract.id.asc()).limit(1)
+        )
+
+    @staticmethod
+    async def reuse(db: AsyncSession, contract: Contract, priority: int = 0) -> Optional[AnalysisJob]:
+        """
+        Returns the job analyzing an existing contract, queuing a new one if its last analysis failed.
+        """
+        if contract.status == ContractStatus.FAILED:
+            job = await job_queue.enqueue(db, contract.id, contract.file_path, priority=priority)
+            contract.status = ContractStatus.PROCESSING
+            await db.commit()
+            return job
+        return await job_queue.active_job(db, contract.id)
+
+    @staticmethod
+    def stored_path(contract: Contract) -> str:
+        # Contracts uploaded before the upload store was introduced live in the working directory
+        return contract.file_path or f"temp_{contract.filename}"
+
+    async def remove_file(self, db: AsyncSession, contract: Contract):
+        """
+        Deletes a contract's document unless another contract still references the same blob.
+        """
+        path = self.stored_path(contract)
+        shared = contract.file_path and await db.scalar(select(Contract.id).where(
+            Contract.file_path == contract.file_path,
+            Contract.id != contract.id
+        ).limit(1))
+        if not shared and os.path.exists(path):
+            await asyncio.to_thread(upload_store.delete, path)
+
+upload_service = UploadService()
@@ -1,42 +1,10 @@
-import sqlite3
-import os
+from app.db.migrations import run_migrations
 
-DB_FILE = "sql_app.db"
+# Schema changes are versioned alembic migrations (alembic/versions) and run on startup.
+# This entry point is kept for deployments that migrate explicitly before starting the app.
 
 def migrate():
-    if not os.path.exists(DB_FILE):
-        print(f"Database file {DB_FILE} not found. Skipping migration.")
-        return
-
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
-    # defined columns to add: name, type
-    columns_to_add = [
-        ("start_date", "DATETIME"),
-        ("end_date", "DATETIME"),
-        ("renewal_terms", "TEXT"),
-        ("notice_period_days", "INTEGER")
-    ]
-
-    print(f"Checking {DB_FILE} for missing columns...")
-    
-    # Get existing columns
-    cursor.execute("PRAGMA table_info(contracts)")
-    existing_columns = [row[1] for row in cursor.fetchall()]
-    
-    for col_name, col_type in columns_to_add:
-        if col_name not in existing_columns:
-            print(f"Adding column: {col_name} ({col_type})")
-            try:
-                cursor.execute(f"ALTER TABLE contracts ADD COLUMN {col_name} {col_type}")
-            except Exception as e:
-                print(f"Error adding {col_name}: {e}")
-        else:
-            print(f"Column {col_name} already exists.")
-
-    conn.commit()
-    conn.close()
+    run_migrations()
     print("Migration complete.")
 
 if __name__ == "__main__":
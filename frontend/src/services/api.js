@@ -23,11 +23,35 @@ export const analyzeContract = async (contractId) => {
     return response.data;
 };
 
-export const getContracts = async () => {
-    const response = await api.get('/contracts');
+export const getJob = async (jobId) => {
+    const response = await api.get(`/jobs/${jobId}`);
     return response.data;
 };
 
+export const cancelJob = async (jobId) => {
+    const response = await api.post(`/jobs/${jobId}/cancel`);
+    return response.data;
+};
+
+// One page of the contract list: { items, next_cursor }. Pass next_cursor as `cursor` for the next page.
+// Optional params: limit, fields, status, risk_level, expires_within_days
+export const getContractsPage = async (params = {}) => {
+    const response = await api.get('/contracts', { params });
+    return response.data;
+};
+
+// Every contract matching params, fetched page by page
+export const getContracts = async (params = {}) => {
+    const items = [];
+    let cursor;
+    do {
+        const page = await getContractsPage({ limit: 100, ...params, ...(cursor ? { cursor } : {}) });
+        items.push(...page.items);
+        cursor = page.next_cursor;
+    } while (cursor);
+    return items;
+};
+
 export const getContract = async (contractId) => {
     const response = await api.get(`/contracts/${contractId}`);
     return response.data;
@@ -49,6 +73,17 @@ export const compareContracts = async (id1, id2) => {
     return response.data;
 };
 
+// Alerts due in the next `within_days` days; optional params: alert_type, status, include_overdue, limit
+export const getAlerts = async (params = {}) => {
+    const response = await api.get('/alerts', { params });
+    return response.data;
+};
+
+export const resolveAlert = async (alertId) => {
+    const response = await api.post(`/alerts/${alertId}/resolve`);
+    return response.data;
+};
+
 export const getAnalytics = async () => {
     const response = await api.get('/analytics/stats');
     return response.data;
@@ -59,4 +94,59 @@ export const rewriteClause = async (clauseText, instruction) => {
     return response.data;
 };
 
+// Reads a Server-Sent Events stream and calls onEvent(event, data) for each event
+export const streamEvents = async (path, { method = 'POST', body, onEvent }) => {
+    const isForm = body instanceof FormData;
+    const response = await fetch(`${api.defaults.baseURL}${path}`, {
+        method,
+        headers: isForm ? undefined : { 'Content-Type': 'application/json' },
+        body: body && !isForm ? JSON.stringify(body) : body,
+    });
+    if (!response.ok) {
+        throw new Error(`Stream request failed: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let event = 'message';
+            let data = '';
+            for (const line of raw.split('\n')) {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            onEvent(event, data ? JSON.parse(data) : {});
+        }
+    }
+};
+
+export const askQuestionStream = (contractId, question, onEvent) =>
+    streamEvents(contractId ? `/ask/${contractId}/stream` : '/ask/global/stream', { body: { question }, onEvent });
+
+export const rewriteClauseStream = (clauseText, instruction, onEvent) =>
+    streamEvents('/rewrite/stream', { body: { clause_text: clauseText, instruction }, onEvent });
+
+export const streamSummary = (contractId, onEvent) =>
+    streamEvents(`/contracts/${contractId}/summary/stream`, { method: 'GET', onEvent });
+
+// Accepts PDF/DOCX files and zip archives; reports per-file status through onEvent
+export const uploadContractsBulk = (files, onEvent) => {
+    const formData = new FormData();
+    for (const file of files) formData.append('files', file);
+    return streamEvents('/upload/bulk', { body: formData, onEvent });
+};
+
+// Compares many contracts against one baseline; each result arrives as a "comparison" event
+export const compareBenchmarkStream = (baselineId, contractIds, onEvent) =>
+    streamEvents('/compare/benchmark', { body: { baseline_id: baselineId, contract_ids: contractIds }, onEvent });
+
 export default api;